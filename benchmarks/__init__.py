@@ -0,0 +1,30 @@
+'''
+- benchmarks            folder to hold all vcp benchmarks
+    - __init__.py       this file
+    - bprint.py         bp calls per second for common output mixes
+    - chunkloop.py      per-call vs preallocated serial_multi chunk loop
+    - compare.py        flags regressions between two phases.py results
+    - instrument.py     per-chunk cost of each --instrument level
+    - phases.py         times each vcp phase on a tree; results to JSON
+    - treegen.py        reproducible synthetic source tree generator
+
+vcp parses its cli args when modules.options is imported, so each benchmark
+sets sys.argv with vcp_argv before importing anything from modules.
+'''
+
+
+import sys
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def vcp_argv(source: str, target: str, *extra: str):
+    """Set the vcp cli args a benchmark runs with. Must be called before the
+    first import from modules.
+
+    - Args:
+        - source (str): an existing source folder
+        - target (str): an existing, empty target folder
+        - extra (str): any other vcp args, e.g. '--blocksize', '64'
+    """
+    sys.argv = ['vcp.py', '-s', source, '-t', target, *extra]
+    return
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Measure bp calls per second for the common output mixes: console with and
+without color, a log file only, date stamped lines, and a verbose line that
+is skipped. Console output goes to an in-memory file and the log file to a
+temp folder. Run from the repo root: python -m benchmarks.bprint"""
+
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+from time import perf_counter
+import betterprint.betterprint as betterprint
+from betterprint.betterprint import bp, bp_dict
+from betterprint.colortext import Ct
+
+
+# ~~~ #        variables
+# name, bp_dict settings, and bp kwargs of each case; log_file is filled in
+CASES = (
+    ('console color', {'color': 1}, {}),
+    ('console no color', {'color': 0}, {}),
+    ('console num=0', {'color': 1}, {'num': 0}),
+    ('log file only', {'color': 1, 'log_file': True}, {'con': 0}),
+    ('console + log', {'color': 0, 'log_file': True}, {}),
+    ('date_log', {'color': 1, 'date_log': 1}, {}),
+    ('skipped veb', {'color': 1}, {'veb': 3}),
+)
+# a typical status line: a few parts, some digits
+TXT = ['Files copied: ', Ct.A, '1,234', Ct.BBLUE, ' of ', Ct.A, '5,678',
+       Ct.BBLUE, ' (135.19 MB) in 12.3456s', Ct.GREEN]
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def run_case(settings: dict, kwargs: dict, calls: int, runs: int):
+    """Call bp calls times per run with the case's settings.
+
+    - Returns:
+        - float: the best run's calls per second
+    """
+    saved = dict(bp_dict)
+    bp_dict.update(settings)
+    stdout, best = sys.stdout, None
+    try:
+        for _ in range(runs):
+            sys.stdout = io.StringIO()
+            t_start = perf_counter()
+            for _ in range(calls):
+                bp(TXT, **kwargs)
+            t_run = perf_counter() - t_start
+            best = t_run if best is None else min(best, t_run)
+    finally:
+        sys.stdout = stdout
+        # write out and close the log before its settings go
+        if betterprint.log_writer:
+            betterprint.log_writer.close()
+        bp_dict.update(saved)
+    return calls / best
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', help='bp calls per run', type=int,
+                        default=50000)
+    parser.add_argument('--runs', help='best of n runs', type=int, default=5)
+    bench_args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, 'bp.log')
+        print(f'{bench_args.calls:,} calls, best of {bench_args.runs}\n'
+              f'{"case":>18} {"calls/s":>12}')
+        for name, settings, kwargs in CASES:
+            if settings.get('log_file'):
+                settings = {**settings, 'log_file': log_file}
+            rate = run_case(settings, kwargs, bench_args.calls,
+                            bench_args.runs)
+            print(f'{name:>18} {rate:>12,.0f}')
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Benchmark the serial_multi chunk loop against the original per-call loop
+(a new bytes object per chunk plus a perf_timer tuple per read, hash, and
+write). Run from the repo root: python -m benchmarks.chunkloop"""
+
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+from time import perf_counter
+from benchmarks import vcp_argv
+# timer doesn't read the cli args, so it is safe to import before vcp_argv
+from modules.timer import perf_timer
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+@perf_timer
+def file_read(file_handle, file_blocks):
+    """The original multifile.file_read: one timed read."""
+    return file_handle.read(file_blocks)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+@perf_timer
+def file_write(file_handle, file_blocks):
+    """The original multifile.file_write: one timed write."""
+    return file_handle.write(file_blocks)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+@perf_timer
+def hash_processing(hash_action, hlib, file_blocks=0):
+    """The original multifile.hash_processing, 'update' action only."""
+    return hlib.update(file_blocks)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def per_call_loop(fr, fw, hlib, fm_dict: dict):
+    """The chunk loop as it was before serial_multi, kept as the baseline."""
+    while True:
+        f_chunk = file_read(fr, fm_dict['read_blocks'])
+        fm_dict['file_read_time'] += f_chunk[1]
+        if not f_chunk[2]:
+            break
+        hash_return = hash_processing('update', hlib, f_chunk[2])
+        fm_dict['hash_time'] += hash_return[1]
+        write_return = file_write(fw, f_chunk[2])
+        fm_dict['file_write_time'] += write_return[1]
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def call_counter():
+    """Build a sys.setprofile hook that counts python and C calls.
+
+    - Returns:
+        - [tuple]: 0 = the hook, 1 = the one item count list it updates
+    """
+    count = [0]
+
+    def hook(frame, event, arg):
+        if event in ('call', 'c_call'):
+            count[0] += 1
+    return hook, count
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def run_loop(loop, source: str, target: str, read_blocks: int,
+             profile=False):
+    """Copy source to target once with the given loop.
+
+    - Returns:
+        - [tuple]: 0 = seconds, 1 = calls made (0 unless profile)
+    """
+    fm_dict = {'read_blocks': read_blocks, 'file_action': 'copy',
+               'short_source': source, 'file_read_time': 0.0,
+               'file_write_time': 0.0, 'hash_time': 0.0}
+    hook, count = call_counter()
+    with open(source, 'rb') as fr, open(target, 'wb') as fw:
+        if profile:
+            sys.setprofile(hook)
+        t_start = perf_counter()
+        loop(fr, fw, hashlib.sha256(), fm_dict)
+        t_total = perf_counter() - t_start
+        sys.setprofile(None)
+    return t_total, count[0]
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', help='test file MB', type=int, default=64)
+    parser.add_argument('--runs', help='best of n runs', type=int, default=5)
+    bench_args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source')
+        target = os.path.join(tmp, 'target')
+        os.mkdir(source)
+        os.mkdir(target)
+        vcp_argv(source, target)
+        from modules.multifile import serial_multi
+
+        def serial_loop(fr, fw, hlib, fm_dict):
+            serial_multi(fr, fw, hlib, fm_dict, 1, 1)
+
+        src_file = os.path.join(source, 'bench.bin')
+        with open(src_file, 'wb') as f:
+            f.write(os.urandom(bench_args.size * 1000000))
+        tgt_file = os.path.join(target, 'bench.bin')
+        print(f'{bench_args.size} MB file, sha256, best of {bench_args.runs}'
+              f'\n{"block":>8} {"loop":>10} {"MB/s":>9} {"us/chunk":>9} '
+              f'{"calls/chunk":>12}')
+        for block in (16000, 64000, 256000, 1000000):
+            chunks = -(-bench_args.size * 1000000 // block)
+            for name, loop in (('per-call', per_call_loop),
+                               ('serial', serial_loop)):
+                best = min(run_loop(loop, src_file, tgt_file, block)[0]
+                           for _ in range(bench_args.runs))
+                calls = run_loop(loop, src_file, tgt_file, block, True)[1]
+                print(f'{block // 1000:>6}kB {name:>10} '
+                      f'{bench_args.size / best:>9,.1f} '
+                      f'{best / chunks * 1000000:>9,.2f} '
+                      f'{calls / chunks:>12,.1f}')
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Compare two benchmarks.phases result files and flag regressions: a phase
+whose throughput dropped, or whose peak RSS grew, by more than the
+threshold. Exits 1 if any regression is found. Run from the repo root:
+python -m benchmarks.compare base.json new.json [--threshold 10]"""
+
+
+import argparse
+import json
+import sys
+
+
+# ~~~ #        variables
+# metric, True if higher is better
+METRICS = (('mb_per_s', True), ('files_per_s', True), ('peak_rss_kb', False))
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def compare(base: dict, new: dict, threshold: float):
+    """Compare every shared phase and metric.
+
+    - Args:
+        - base (dict): the baseline results
+        - new (dict): the results to check
+        - threshold (float): percent change allowed before a regression
+
+    - Returns:
+        - list: (phase, metric, base value, new value, percent change,
+                regression bool) for each comparison
+    """
+    rows = []
+    for phase, base_res in base['phases'].items():
+        new_res = new['phases'].get(phase)
+        if new_res is None:
+            continue
+        for metric, higher in METRICS:
+            old, cur = base_res.get(metric), new_res.get(metric)
+            # byte-less phases have no MB/s, and RSS may be unavailable
+            if not old or cur is None:
+                continue
+            change = (cur - old) / old * 100
+            worse = -change if higher else change
+            rows.append((phase, metric, old, cur, change, worse > threshold))
+    return rows
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('base', help='baseline results JSON')
+    parser.add_argument('new', help='results JSON to check')
+    parser.add_argument('--threshold', help='percent change allowed',
+                        type=float, default=10.0)
+    cmp_args = parser.parse_args()
+    with open(cmp_args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(cmp_args.new, encoding='utf-8') as f:
+        new = json.load(f)
+
+    # results are only comparable for the same tree and vcp args
+    for key in ('tree', 'vcp_args', 'cpus'):
+        if base['meta'].get(key) != new['meta'].get(key):
+            print(f'WARNING: {key} differs: {base["meta"].get(key)} vs '
+                  f'{new["meta"].get(key)}')
+    rows = compare(base, new, cmp_args.threshold)
+    print(f'{"phase":>10} {"metric":>12} {"base":>12} {"new":>12} '
+          f'{"change":>8}')
+    for phase, metric, old, cur, change, regressed in rows:
+        print(f'{phase:>10} {metric:>12} {old:>12,.1f} {cur:>12,.1f} '
+              f'{change:>+7.1f}%{"  REGRESSION" if regressed else ""}')
+    regressions = sum(z[5] for z in rows)
+    print(f'\n{regressions} regression(s) beyond {cmp_args.threshold}%')
+    sys.exit(1 if regressions else 0)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Measure what each --instrument level adds to the serial_multi chunk loop.
+The file is copied between in-memory files with a no-op hash, so the loop
+and its timer calls are all that is measured. Run from the repo root:
+python -m benchmarks.instrument"""
+
+
+import argparse
+import io
+import os
+import tempfile
+from time import perf_counter
+from benchmarks import vcp_argv
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class NullHash:
+    """A hashlib stand-in that does no work."""
+    def update(self, data):
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def run_level(data: bytes, block: int, runs: int):
+    """Copy data once per run through serial_multi at the current level.
+
+    - Returns:
+        - float: the best run in seconds
+    """
+    from modules.multifile import serial_multi
+    best = None
+    for _ in range(runs):
+        fm_dict = {'read_blocks': block, 'file_action': 'copy',
+                   'file_source': 'bench', 'short_source': 'bench',
+                   'file_size': len(data), 'file_read_time': 0.0,
+                   'file_write_time': 0.0, 'hash_time': 0.0}
+        fr, fw = io.BytesIO(data), io.BytesIO()
+        t_start = perf_counter()
+        serial_multi(fr, fw, NullHash(), fm_dict, 1, 1)
+        t_run = perf_counter() - t_start
+        best = t_run if best is None else min(best, t_run)
+    return best
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', help='test data MB', type=int, default=64)
+    parser.add_argument('--block', help='chunk bytes; small chunks show the '
+                        'per-chunk cost', type=int, default=4096)
+    parser.add_argument('--runs', help='best of n runs', type=int, default=5)
+    bench_args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source')
+        target = os.path.join(tmp, 'target')
+        os.mkdir(source)
+        os.mkdir(target)
+        vcp_argv(source, target)
+        import modules.instrument as instrument
+
+        data = os.urandom(bench_args.size * 1000000)
+        chunks = -(-len(data) // bench_args.block)
+        print(f'{bench_args.size} MB in {bench_args.block:,} byte chunks, '
+              f'no-op hash, best of {bench_args.runs}\n'
+              f'{"level":>14} {"ns/chunk":>9} {"+ns/chunk":>10}')
+        base = None
+        for name, level, sample in (('off', 'off', 0), ('file', 'file', 0),
+                                    ('trace 1/100', 'trace', 100),
+                                    ('trace 1/1', 'trace', 1)):
+            instrument.level = level
+            # the tracer writes sampled chunks to a file, as with
+            # --trace-file
+            instrument.tracer = instrument.Tracer(
+                os.path.join(tmp, 'trace.jsonl'), sample) if sample else None
+            best = run_level(data, bench_args.block, bench_args.runs)
+            if instrument.tracer:
+                instrument.tracer.close()
+            per_chunk = best / chunks * 1e9
+            base = per_chunk if base is None else base
+            print(f'{name:>14} {per_chunk:>9,.0f} {per_chunk - base:>+10,.0f}')
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+if __name__ == '__main__':
+    main()
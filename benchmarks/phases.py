@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Run vcp's phases (walk, folder create, copy, validate, stat reset) against
+a generated or existing source tree and record each phase's time,
+throughput, files/s, and peak RSS to JSON. Any option not listed here is
+passed on to vcp, e.g. --workers 4 or --engine kernel. Run from the repo
+root: python -m benchmarks.phases --out results.json [options]"""
+
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+import json
+import os
+import platform
+import shutil
+from statistics import median
+import sys
+import tempfile
+from time import perf_counter
+from benchmarks import vcp_argv
+from benchmarks.treegen import gen_args, tree_generate
+try:
+    import resource
+except ImportError:
+    resource = None     # no peak RSS off posix
+
+
+# ~~~ #        variables
+# phase names in run order
+PHASES = ('walk', 'folders', 'copy', 'validate', 'stat_reset')
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def peak_rss():
+    """The process peak RSS so far in kB, or None if it can't be read."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kB
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def phase_result(seconds: float, files: int, nbytes: int, failures=0):
+    """Build one phase's result dict.
+
+    - Returns:
+        - dict: 'seconds', 'files', 'bytes', 'files_per_s', 'mb_per_s',
+                'failures', and 'peak_rss_kb'
+    """
+    return {'seconds': seconds, 'files': files, 'bytes': nbytes,
+            'files_per_s': files / seconds if seconds else 0.0,
+            'mb_per_s': nbytes / 1000000 / seconds if seconds else 0.0,
+            'failures': failures, 'peak_rss_kb': peak_rss()}
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def run_phases():
+    """Copy the source to the (empty) target once, phase by phase. Copy and
+    validate use file_copy and file_validate on --workers threads, so the
+    two are timed apart; file_logic would interleave them.
+
+    - Returns:
+        - dict: k: phase name; v: phase_result dict
+    """
+    from modules.createfolder import folder_logic, folder_stat_reset
+    from modules.multifile import file_copy, file_validate
+    from modules.options import args
+    from modules.treewalk import tree_walk
+    results = {}
+
+    # ~~~ #             -walk-
+    walk_return = tree_walk()
+    dirs, files, stats = walk_return[2]
+    results['walk'] = phase_result(walk_return[1], stats['num_files'] +
+                                   stats['num_dirs'], 0)
+
+    # ~~~ #             -folders-
+    folder_return = folder_logic(dirs)
+    results['folders'] = phase_result(folder_return[1], dirs.num_dirs(), 0,
+                                      folder_return[2]['failure'])
+
+    # ~~~ #             -copy and validate-
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        run = pool.map if args.workers > 1 else map
+        t_start = perf_counter()
+        cv_list = list(run(partial(file_copy, validate=False),
+                           *zip(*files)))
+        t_copy = perf_counter() - t_start
+        copied = [z['copy'] for z in cv_list if z['copy']['failure'] == 0]
+        results['copy'] = phase_result(t_copy, len(copied),
+                                       sum(z['file_size'] for z in copied),
+                                       len(cv_list) - len(copied))
+        t_start = perf_counter()
+        cv_list = list(run(file_validate, cv_list))
+        t_val = perf_counter() - t_start
+    validated = [z for z in cv_list if z['val'] and z['val']['failure'] == 0
+                 and z['val']['hash_hex'] == z['copy']['hash_hex']]
+    results['validate'] = phase_result(
+        t_val, len(validated), sum(z['val']['file_size'] for z in validated),
+        len(cv_list) - len(validated))
+
+    # ~~~ #             -stat reset-
+    reset_return = folder_stat_reset(folder_return[2])
+    results['stat_reset'] = phase_result(
+        reset_return[1], folder_return[2]['success'], 0)
+    return results
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--out', help='results JSON file', required=True)
+    parser.add_argument('--tree', help='existing source tree; otherwise one '
+                        'is generated from the tree options')
+    parser.add_argument('--runs', help='runs; each phase reports its median',
+                        type=int, default=3)
+    gen_args(parser)
+    bench_args, vcp_extra = parser.parse_known_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # ~~~ #         -source tree-
+        if bench_args.tree:
+            source = os.path.abspath(bench_args.tree)
+            tree = {'path': source}
+        else:
+            source = os.path.join(tmp, 'source')
+            print('Generating tree...', flush=True)
+            tree = tree_generate(source, bench_args.files, bench_args.depth,
+                                 bench_args.fanout, bench_args.sizes,
+                                 bench_args.sparse, bench_args.hardlinks,
+                                 bench_args.seed)
+        target = os.path.join(tmp, 'target')
+        os.mkdir(target)
+        vcp_argv(source, target, *vcp_extra)
+        import modules.options as options
+
+        # ~~~ #         -runs-
+        runs = []
+        for run_num in range(1, bench_args.runs + 1):
+            runs.append(run_phases())
+            print(f'run {run_num}: ' + ', '.join(
+                f'{z} {runs[-1][z]["seconds"]:.3f}s' for z in PHASES),
+                flush=True)
+            shutil.rmtree(target)
+            os.mkdir(target)
+
+    # ~~~ #             -results-
+    # each phase comes from the run with its median time
+    phases = {}
+    for phase in PHASES:
+        times = [z[phase]['seconds'] for z in runs]
+        mid = median(times)
+        phases[phase] = dict(min(runs, key=lambda z: abs(
+            z[phase]['seconds'] - mid))[phase], runs=times)
+    result = {
+        'meta': {'version': options.ver, 'vcp_args': vcp_extra,
+                 'tree': tree, 'runs': bench_args.runs,
+                 'python': platform.python_version(),
+                 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                 'date': datetime.now().isoformat(timespec='seconds')},
+        'phases': phases}
+    with open(bench_args.out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f'\n{"phase":>10} {"seconds":>9} {"files/s":>10} {"MB/s":>9} '
+          f'{"RSS MB":>8}')
+    for phase, res in phases.items():
+        rss = res['peak_rss_kb'] / 1000 if res['peak_rss_kb'] else 0
+        print(f'{phase:>10} {res["seconds"]:>9,.3f} '
+              f'{res["files_per_s"]:>10,.0f} {res["mb_per_s"]:>9,.1f} '
+              f'{rss:>8,.1f}')
+    print(f'\nwrote {bench_args.out}')
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Generate a synthetic source tree for the vcp benchmarks. The same options
+and seed always give the same tree. Run from the repo root:
+python -m benchmarks.treegen <root> [options]"""
+
+
+import argparse
+import json
+import os
+import random
+
+
+# ~~~ #        variables
+# a small-file heavy mix, loosely shaped like a source code tree
+DEFAULT_SIZES = '1k:40,8k:30,64k:20,1m:8,16m:2'
+# size suffixes accepted in a size spec
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+# bytes written per call while filling a file
+FILL_BLOCK = 1024 * 1024
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def size_parse(spec: str):
+    """Parse a file size distribution such as '4k:70,1m:25,64m:5'.
+
+    - Args:
+        - spec (str): comma separated size:weight pairs
+
+    - Returns:
+        - [tuple]: 0 = list of sizes in bytes, 1 = list of weights
+    """
+    sizes, weights = [], []
+    for item in spec.split(','):
+        size, _, weight = item.strip().lower().partition(':')
+        unit = size[-1] if size[-1] in SIZE_UNITS else ''
+        sizes.append(int(float(size[:len(size) - len(unit)]) *
+                         SIZE_UNITS[unit]))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def folder_tree(root: str, depth: int, fanout: int):
+    """List the folders of a tree with fanout sub folders per folder, down
+    to depth levels below root.
+
+    - Returns:
+        - list: every folder, root first
+    """
+    folders, level = [root], [root]
+    for _ in range(depth):
+        level = [os.path.join(parent, f'd{idx:03d}') for parent in level
+                 for idx in range(fanout)]
+        folders += level
+    return folders
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def file_fill(path: str, size: int, rng: random.Random, sparse: bool):
+    """Write one file of size bytes. Data is seeded random bytes so it can't
+    be compressed or deduplicated; a sparse file only gets data in its first
+    and last block.
+    """
+    with open(path, 'wb') as f:
+        if sparse:
+            f.truncate(size)
+            for offset in {0, max(0, size - 4096)}:
+                f.seek(offset)
+                f.write(rng.randbytes(min(4096, size - offset)))
+            return
+        done = 0
+        while done < size:
+            block = min(FILL_BLOCK, size - done)
+            f.write(rng.randbytes(block))
+            done += block
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def tree_generate(root: str, files=1000, depth=3, fanout=4,
+                  sizes=DEFAULT_SIZES, sparse=0.0, hardlinks=0.0, seed=1):
+    """Create the tree. Files are spread evenly over all folders; a sparse
+    fraction of them are sparse files and a hardlinks fraction are hard
+    links to an earlier file.
+
+    - Args:
+        - root (str): the folder to create the tree in; must be empty
+        - files (int, optional): number of files. Defaults to 1000.
+        - depth (int, optional): folder levels below root. Defaults to 3.
+        - fanout (int, optional): sub folders per folder. Defaults to 4.
+        - sizes (str, optional): size distribution for size_parse.
+        - sparse (float, optional): fraction of sparse files. Defaults to 0.
+        - hardlinks (float, optional): fraction of hard links. Defaults to 0.
+        - seed (int, optional): random seed. Defaults to 1.
+
+    - Returns:
+        - dict: the options used plus 'folders', 'bytes' (apparent size of
+                every file), 'sparse_files', and 'hardlinks_made'
+    """
+    rng = random.Random(seed)
+    size_list, weight_list = size_parse(sizes)
+    folders = folder_tree(root, depth, fanout)
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+    spec = {'files': files, 'depth': depth, 'fanout': fanout, 'sizes': sizes,
+            'sparse': sparse, 'hardlinks': hardlinks, 'seed': seed,
+            'folders': len(folders), 'bytes': 0, 'sparse_files': 0,
+            'hardlinks_made': 0}
+    made = []
+    for idx in range(files):
+        path = os.path.join(folders[idx % len(folders)], f'f{idx:07d}.bin')
+        if made and rng.random() < hardlinks:
+            link_to = rng.choice(made)
+            os.link(link_to[0], path)
+            spec['hardlinks_made'] += 1
+            spec['bytes'] += link_to[1]
+            continue
+        size = rng.choices(size_list, weight_list)[0]
+        is_sparse = size > 8192 and rng.random() < sparse
+        file_fill(path, size, rng, is_sparse)
+        spec['sparse_files'] += is_sparse
+        spec['bytes'] += size
+        made.append((path, size))
+    return spec
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def gen_args(parser: argparse.ArgumentParser):
+    """Add the tree options to a parser; shared with benchmarks.phases."""
+    parser.add_argument('--files', help='number of files', type=int,
+                        default=1000)
+    parser.add_argument('--depth', help='folder levels', type=int, default=3)
+    parser.add_argument('--fanout', help='sub folders per folder', type=int,
+                        default=4)
+    parser.add_argument('--sizes', help='size:weight list, e.g. '
+                        f'"{DEFAULT_SIZES}"', default=DEFAULT_SIZES)
+    parser.add_argument('--sparse', help='fraction of sparse files',
+                        type=float, default=0.0)
+    parser.add_argument('--hardlinks', help='fraction of hard links',
+                        type=float, default=0.0)
+    parser.add_argument('--seed', help='random seed', type=int, default=1)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('root', help='empty or new folder for the tree')
+    gen_args(parser)
+    gen = parser.parse_args()
+    if os.path.isdir(gen.root) and os.listdir(gen.root):
+        parser.error(f'{gen.root} is not empty')
+    spec = tree_generate(gen.root, gen.files, gen.depth, gen.fanout,
+                         gen.sizes, gen.sparse, gen.hardlinks, gen.seed)
+    print(json.dumps(spec, indent=2))
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+if __name__ == '__main__':
+    main()
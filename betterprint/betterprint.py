@@ -2,8 +2,11 @@
 '''better print (bp) version 0.3.1'''
 
 
-from datetime import datetime
+import atexit
+import queue
 import sys
+import threading
+from time import localtime, monotonic, strftime, time
 from betterprint.colortext import Ct
 import betterprint.version as version
 
@@ -19,6 +22,8 @@ bp_dict = {
     'date_log': 0,              # prepend date to each output
     'log_file': None,           # the log file name for all output
     'error_log_file': None,     # the error log file name for only errors
+    'log_flush_bytes': 65536,   # flush log files once this much is written
+    'log_flush_secs': 1.0,      # or once this long has passed
     'quiet': 0,                 # allows surpressing cli errors
     'verbose': 0,               # match this verbose to bp veb; skip if lower
     'con': 1,                   # permanently override the default con setting
@@ -30,6 +35,151 @@ bp_dict = {
     'num': 1,                   # permanently override the default num setting
     'veb': 0                    # permanently override the default veb setting
 }
+# the background log file writer, started by the first log line
+log_writer = None
+log_writer_lock = threading.Lock()
+# k: a part's Ct color; v: the str.translate table bp num=1 colors its
+# digits with
+digit_tables = {}
+# (epoch second, '[%H:%M:%S]') of the last date_log prefix made
+date_cache = (None, '')
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+class LogWriter:
+    """Keeps the log files open and writes them on a background thread, so a
+    bp call only queues its line. Written lines are flushed once
+    bp_dict['log_flush_bytes'] have built up or bp_dict['log_flush_secs'] have
+    passed, right after any error or warning line, and at exit.
+    """
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        # k: file name; v: the open file
+        self.files = {}
+        self.thread = threading.Thread(target=self.run, name='bp-log',
+                                       daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, file_name: str, line: str, err: int):
+        """Queue a line. The file is opened here on its first line, so an
+        open error is raised to the bp caller.
+
+        Args:
+            - file_name (str): the log file
+            - line (str): the text, with its end-of-line
+            - err (int): the bp err level; above 0 flushes straight away
+        """
+        f = self.files.get(file_name)
+        if f is None:
+            with log_writer_lock:
+                f = self.files.get(file_name)
+                if f is None:
+                    f = self.files[file_name] = open(file_name, 'a')
+        self.queue.put((f, line, err))
+
+    def run(self):
+        """Writer thread: write queued lines and flush on the thresholds."""
+        dirty, pending, last = set(), 0, monotonic()
+        while True:
+            try:
+                wait = max(0.0, bp_dict['log_flush_secs'] -
+                           (monotonic() - last)) if dirty else None
+                item = self.queue.get(timeout=wait)
+            except queue.Empty:
+                item = ()           # the time threshold passed
+            if item is None:
+                break
+            if item:
+                f, line, err = item
+                try:
+                    f.write(line)
+                except (OSError, ValueError) as e:
+                    bp([f'exception caught trying to write to {f.name}\n\t'
+                        f'{e}', Ct.RED], err=1, fil=0)
+                    continue
+                dirty.add(f)
+                pending += len(line)
+                if not err and pending < bp_dict['log_flush_bytes'] and \
+                        monotonic() - last < bp_dict['log_flush_secs']:
+                    continue
+            self.flush(dirty)
+            dirty, pending, last = set(), 0, monotonic()
+        self.flush(dirty)
+
+    def flush(self, dirty: set):
+        """Flush the files written since the last flush."""
+        for f in dirty:
+            try:
+                f.flush()
+            except (OSError, ValueError) as e:
+                bp([f'exception caught trying to write to {f.name}\n\t{e}',
+                    Ct.RED], err=1, fil=0)
+
+    def close(self):
+        """Write everything queued, then close the files. Registered to run
+        at exit."""
+        global log_writer
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+        for f in self.files.values():
+            f.close()
+        with log_writer_lock:
+            if log_writer is self:
+                log_writer = None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def log_write(file_name: str, line: str, err: int):
+    """Hand a log line to the LogWriter, starting it on first use.
+
+    Args:
+        - file_name (str): the log file
+        - line (str): the text, with its end-of-line
+        - err (int): the bp err level
+    """
+    global log_writer
+    if log_writer is None:
+        with log_writer_lock:
+            if log_writer is None:
+                log_writer = LogWriter()
+    log_writer.write(file_name, line, err)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def digit_table(ctxt: str):
+    """The translate table that colors each digit bright blue and then
+    returns to ctxt, made once per color.
+
+    Args:
+        - ctxt (str): the Ct color of the text part
+
+    Return:
+        - dict: the str.translate table
+    """
+    table = digit_tables.get(ctxt)
+    if table is None:
+        table = digit_tables[ctxt] = {
+            ord(d): f'{Ct.BBLUE}{d}{ctxt}' for d in '0123456789'}
+    return table
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def date_prefix():
+    """The date_log time stamp, formatted at most once a second.
+
+    Return:
+        - str: the local time as [HH:MM:SS]
+    """
+    global date_cache
+    now = int(time())
+    sec, text = date_cache
+    if sec != now:
+        text = strftime('[%H:%M:%S]', localtime(now))
+        date_cache = (now, text)
+    return text
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -75,13 +225,6 @@ def bp(txt: list, con=bp_dict['con'], err=bp_dict['err'], fil=bp_dict['fil'],
     Return:
         - None
     """
-    # ~~~ #             -variables-
-    global bp_dict
-    bp_local_dict = {
-        'con_out': '',
-        'file_out': ''
-    }
-
     # ~~~ #             -all print tracking-
     # track function call even if no output
     bp_dict['bp_tracker_all'] += 1
@@ -98,86 +241,81 @@ def bp(txt: list, con=bp_dict['con'], err=bp_dict['err'], fil=bp_dict['fil'],
         raise Exception(f'{Ct.RED}"Better Print" (bp) function -> "txt: (list)'
                         f'": must be in pairs (txt length = {txt_l}){Ct.A}')
 
-    # ~~~ #             -veb-
-    # prepend INFO-L(x) to output
-    if veb > 0 and err == 0 and log > 0:
-        bp_local_dict['con_out'] = f'INFO-L{veb}: '
-        bp_local_dict['file_out'] = f'INFO-L{veb}: '
+    # ~~~ #             -sinks-
+    # only build the text a sink will actually receive
+    con_on = con == 1
+    fil_on = fil == 1 and bool(bp_dict['log_file'] or (
+        err > 0 and bp_dict['error_log_file']))
+    if not con_on and not fil_on:
+        return
+    color_on = con_on and bp_dict['color'] == 1
 
-    # ~~~ #             -err-
-    # pre-pend Error or Warning, overwriting -veb- section
+    # ~~~ #             -veb and err-
+    # prepend INFO-L(x) to output; Error or Warning overwrites it
+    con_pre = file_pre = ''
     if err == 1:
-        bp_local_dict['con_out'] = f'{Ct.YELLOW}WARNING: {Ct.A}'
-        bp_local_dict['file_out'] = 'WARNING: '
+        con_pre, file_pre = f'{Ct.YELLOW}WARNING: {Ct.A}', 'WARNING: '
     elif err == 2:
-        bp_local_dict['con_out'] = f'{Ct.RED}ERROR: {Ct.A}'
-        bp_local_dict['file_out'] = 'ERROR: '
-
-    # ~~~ #             -colorize and assemble-
-    # need enumerate to identify even entries that contain strings
-    for idx, val in enumerate(txt):
-        if idx % 2 == 0:
-            if type(val) != str:
-                raise Exception(f'{Ct.RED}"Better Print" (bp) function -> "txt'
-                                f' list even entries must be str. txt type = '
-                                f'{type(val)}{Ct.A}')
-            ttxt = ''               # even text val to be joined
-            ctxt = txt[idx + 1]     # odd color val to color ttxt
-            # colorize numbers and reset to default
-            if num == 1 and ctxt == Ct.A:
-                for idx in val[:]:
-                    ttxt += f'{Ct.BBLUE}{idx}{Ct.A}' if idx.isdigit() else idx
-            # colorize numbers and reset to requested color for that part
-            elif num == 1:
-                for idx in val[:]:
-                    ttxt += f'{Ct.BBLUE}{idx}{ctxt}' if idx.isdigit() else idx
-            # don't colorize numbers (equivalent to num=0)
-            else:
-                ttxt = val
-            # now wrap the color numbered string with the requested color
-            bp_local_dict['con_out'] += f'{ctxt}{ttxt}{Ct.A}'
-            # file output is the original value with no console coloration
-            bp_local_dict['file_out'] += val[:]
+        con_pre, file_pre = f'{Ct.RED}ERROR: {Ct.A}', 'ERROR: '
+    elif veb > 0 and log > 0:
+        con_pre = file_pre = f'INFO-L{veb}: '
+
+    # ~~~ #             -assemble-
+    # file output is the text with no console coloration; join raises on a
+    # non str text entry
+    try:
+        file_out = ''.join(txt[::2])
+    except TypeError:
+        bad = next(type(val) for val in txt[::2] if type(val) != str)
+        raise Exception(f'{Ct.RED}"Better Print" (bp) function -> "txt list '
+                        f'even entries must be str. txt type = {bad}'
+                        f'{Ct.A}') from None
+    file_out = file_pre + file_out
+
+    # ~~~ #             -colorize-
+    # each digit goes bright blue, then back to its part's color
+    if color_on:
+        parts = [con_pre]
+        for val, ctxt in zip(txt[::2], txt[1::2]):
+            if num == 1:
+                val = val.translate(digit_table(ctxt))
+            parts.append(f'{ctxt}{val}{Ct.A}')
+        con_out = ''.join(parts)
 
     # ~~~ #             -log-
     # allow log=0 to bypass this
     if bp_dict['date_log'] == 1 and log == 1:
-        dt_now = datetime.now().strftime('[%H:%M:%S]')
-        bp_local_dict['con_out'] = (
-            f'{dt_now}-{bp_dict["bp_tracker_con"] + 1}'
-            f'-{bp_local_dict["con_out"]}')
-        bp_local_dict['file_out'] = (
-            f'{dt_now}-{bp_dict["bp_tracker_log"] + 1}'
-            f'-{bp_local_dict["file_out"]}')
+        dt_now = date_prefix()
+        if color_on:
+            con_out = f'{dt_now}-{bp_dict["bp_tracker_con"] + 1}-{con_out}'
+        file_out = f'{dt_now}-{bp_dict["bp_tracker_log"] + 1}-{file_out}'
 
     # ~~~ #             -color-
-    # after all colorization sections, set cli to file if no color desired
-    if bp_dict['color'] == 0:
-        bp_local_dict['con_out'] = bp_local_dict['file_out'][:]
+    # with no color the cli gets the file text as is
+    if not color_on:
+        con_out = file_out
 
     # ~~~ #             -con-
     # skips con output if con=0
-    if inl == 0 and con == 1:                   # default with new line
-        sys.stdout.write(f'{bp_local_dict["con_out"]}\n')
-        bp_dict['bp_tracker_con'] += 1
-    elif inl == 1 and fls == 0 and con == 1:    # in-line with no flush
-        sys.stdout.write(bp_local_dict['con_out'])
-        bp_dict['bp_tracker_con'] += 1
-    elif inl == 1 and fls == 1 and con == 1:    # in-line with flush
+    if con_on:
         bp_dict['bp_tracker_con'] += 1
-        sys.stdout.write(bp_local_dict['con_out'])
-        sys.stdout.flush()
+        if inl == 0:                            # default with new line
+            sys.stdout.write(f'{con_out}\n')
+        else:                                   # in-line
+            sys.stdout.write(con_out)
+            if fls == 1:                        # in-line with flush
+                sys.stdout.flush()
 
     # ~~~ #             -file-
     try:
         # skip if file loging not requested or fil=0
-        if bp_dict['log_file'] and fil == 1:
-            with open(bp_dict['log_file'], 'a') as f:
-                f.write(bp_local_dict['file_out'] + '\n')
-        # separate errors into dedicated error log
-        if bp_dict['error_log_file'] and err > 0 and fil == 1:
-            with open(bp_dict['error_log_file'], 'a') as f:
-                f.write(bp_local_dict['file_out'] + '\n')
+        if fil_on:
+            file_out += '\n'
+            if bp_dict['log_file']:
+                log_write(bp_dict['log_file'], file_out, err)
+            # separate errors into dedicated error log
+            if bp_dict['error_log_file'] and err > 0:
+                log_write(bp_dict['error_log_file'], file_out, err)
     except OSError as e:
         bp([f'exception caught trying to write to {bp_dict["log_file"]} '
             f'or {bp_dict["error_log_file"]}\n\t{e}', Ct.RED], err=1, fil=0)
@@ -3,12 +3,30 @@
 - modules               folder to hold all vcp modules
     - __init__.py       this file
     - arguments.py      argparse cli arguments
+    - blocktune.py      --auto-block per-file and per-device chunk sizes
     - createfolder.py   creates folders
+    - engines.py        alternate single-file copy engines (pipeline, kernel,
+                        direct)
     - freespace.py      get free space on a specified path
+    - instrument.py     --instrument timing levels and the sampled chunk
+                        tracer
+    - manifest.py       checksum manifest output and verify-only mode
+    - metrics.py        counters and latency histograms exported to JSON and
+                        Prometheus text files during the run
     - multifile.py      file read/copy/hash-validation logic
+    - nocache.py        target flush and page cache drop for validation
     - notations.py      simple B/kB/MB/GB/TB converter for raw byte input
+    - progress.py       rate-limited copy progress display on its own thread
+    - pathfilter.py     compiled --exdir/--exfile glob and regex matcher
     - options.py        global options that can be imported by other modules
+    - results.py        scratch sqlite store of per-file results for the
+                        summary and failure report
+    - resume.py         append-only --resume journal of finished and partial
+                        files
+    - syncindex.py      sqlite index of validated files for --sync
     - timer.py          timing decorator using time.perf_counter
+    - treehash.py       parallel chunked Merkle tree hashes (--hash tree-*)
+    - treemodel.py      compact walked tree: folder nodes and file columns
     - treewalk.py       walks folder structure to find all files and folders
     - version.py        program version
 '''
@@ -6,6 +6,7 @@ from pathlib import Path
 import sys
 from betterprint.betterprint import bp
 from betterprint.colortext import Ct
+from modules.treehash import tree_hashes, TREE_CHUNK
 import modules.version as version
 
 
@@ -86,7 +87,9 @@ def get_args():
                         metavar=f'{Ct.RED}<path>{Ct.A}',
                         type=str)
     parser.add_argument('--hash',
-                        help='hash type to use',
+                        help='hash type to use; "tree-<hash>" hashes '
+                             'large files in parallel chunks (see '
+                             '--available)',
                         metavar=f'{Ct.GREEN}<hash>{Ct.A}',
                         type=str,
                         default='sha256')
@@ -103,19 +106,132 @@ def get_args():
                         metavar=f'{Ct.GREEN}<number>{Ct.A}',
                         type=int,
                         default=16)
+    parser.add_argument('--auto-block',
+                        help='pick the read/write size per file from its '
+                             'size and the device block size, and tune it '
+                             'per device on measured throughput; '
+                             '--blocksize is ignored',
+                        action='store_true')
+    parser.add_argument('--stream',
+                        help='create folders and copy files while the tree '
+                             'walk is still running',
+                        action='store_true')
+    parser.add_argument('--sync',
+                        help='only copy files that are new or changed since '
+                             'the last --sync run, tracked in an index in '
+                             'the target root',
+                        action='store_true')
+    parser.add_argument('--resume',
+                        help='journal progress in the target root; run '
+                             'again with --resume after an interruption to '
+                             'skip finished files and continue large files '
+                             'from their last checkpoint (serial engine)',
+                        action='store_true')
+    parser.add_argument('--workers',
+                        help='number of files to copy and validate at the '
+                             'same time (1-256)',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=1)
+    parser.add_argument('--walkers',
+                        help='number of folders to list at the same time '
+                             'during the tree walk (1-256); helps on network '
+                             'shares and very wide trees',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=1)
+    parser.add_argument('--folder-threads',
+                        help='folders created at the same time, one tree '
+                             'level after another (1-256)',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=8)
+    parser.add_argument('--buffer-limit',
+                        help='max MB of read buffers held by all workers at '
+                             'once; new files wait until buffers are freed',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=256)
+    parser.add_argument('--engine',
+                        help='file copy engine; "pipeline" reads, hashes, '
+                             'and writes each file on overlapping threads, '
+                             '"kernel" copies with copy_file_range/sendfile '
+                             'and hashes from mmap, "direct" writes files of '
+                             'at least --direct-min MB with O_DIRECT',
+                        choices=['serial', 'pipeline', 'kernel', 'direct'],
+                        type=str,
+                        default='serial')
+    parser.add_argument('--direct-min',
+                        help='smallest file in MB written with O_DIRECT by '
+                             '"--engine direct"; smaller files use "serial"',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=1000)
+    parser.add_argument('--ring',
+                        help='number of blocksize buffers each file cycles '
+                             'through with "--engine pipeline" (2-64)',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=3)
+    parser.add_argument('--overlap',
+                        help='validate copied files in a separate stage '
+                             'while the next files are copied',
+                        action='store_true')
+    parser.add_argument('--val-threads',
+                        help='validation threads with "--overlap" (1-256)',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=1)
+    parser.add_argument('--val-queue',
+                        help='max copied files waiting for validation with '
+                             '"--overlap"',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=64)
+    parser.add_argument('--val-nocache',
+                        help='validate from the target media: flush each '
+                             'batch of copies and drop cached pages before '
+                             'hashing; also drops source pages after hashing',
+                        action='store_true')
+    parser.add_argument('--sync-batch',
+                        help='files copied per flush with "--val-nocache"',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=64)
+    parser.add_argument('--progress-hz',
+                        help='status redraws per second on a terminal; off '
+                             'a terminal or with -v a progress line is '
+                             'printed every 10 seconds instead',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=float,
+                        default=4.0)
     parser.add_argument('--date-log',
                         help='add timestamp logging to output',
                         action='store_true')
     parser.add_argument('--exdir',
                         help='comma separated directories to exclude (no '
-                             'spaces between directories)',
+                             'spaces between directories); globs, or '
+                             '"re:<regex>", matched against the path '
+                             'relative to source; excluded directories are '
+                             'not walked',
                         metavar=f'{Ct.GREEN}<dir>,<dir>{Ct.A}',
                         type=str)
     parser.add_argument('--exfile',
                         help='comma separated files to exclude (no spaces '
-                             'between files)',
+                             'between files); same patterns as --exdir',
                         metavar=f'{Ct.GREEN}<file>,<file>{Ct.A}',
                         type=str)
+    parser.add_argument('--exclude-from',
+                        help='file of exclude patterns, one per line; '
+                             'patterns ending in "/" exclude directories',
+                        metavar=f'{Ct.GREEN}<filename>{Ct.A}',
+                        type=str)
+    parser.add_argument('--include-from',
+                        help='file of include patterns, one per line; only '
+                             'matching files (or files under matching '
+                             '"dir/" lines) are copied',
+                        metavar=f'{Ct.GREEN}<filename>{Ct.A}',
+                        type=str)
     parser.add_argument('--log-file',
                         help='file to save output',
                         metavar=f'{Ct.GREEN}<filename>{Ct.A}',
@@ -124,6 +240,60 @@ def get_args():
                         help='file to save output',
                         metavar=f'{Ct.GREEN}<filename>{Ct.A}',
                         type=str)
+    parser.add_argument('--manifest',
+                        help='file to stream a sha256sum compatible '
+                             'manifest of validated files to',
+                        metavar=f'{Ct.GREEN}<filename>{Ct.A}',
+                        type=str)
+    parser.add_argument('--results-dir',
+                        help='folder for the run\'s scratch per-file results '
+                             'store (default: the system temp folder); '
+                             'roughly 100 bytes a file',
+                        metavar=f'{Ct.GREEN}<folder>{Ct.A}',
+                        type=str)
+    parser.add_argument('--verify-manifest',
+                        help='only re-check the target against a manifest '
+                             'using --workers threads; no source needed',
+                        metavar=f'{Ct.GREEN}<filename>{Ct.A}',
+                        type=str)
+    parser.add_argument('--metrics-json',
+                        help='file to write a JSON metrics report to during '
+                             'the run: per-file and per-chunk latency '
+                             'histograms, per-device throughput, queue '
+                             'depths, and the slowest files',
+                        metavar=f'{Ct.GREEN}<filename>{Ct.A}',
+                        type=str)
+    parser.add_argument('--metrics-prom',
+                        help='file to write the same metrics to in the '
+                             'Prometheus text format, e.g. for the '
+                             'node_exporter textfile collector',
+                        metavar=f'{Ct.GREEN}<filename>{Ct.A}',
+                        type=str)
+    parser.add_argument('--metrics-interval',
+                        help='seconds between metrics file updates',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=float,
+                        default=10.0)
+    parser.add_argument('--instrument',
+                        help='timing detail; "off" makes no timer calls in '
+                             'the serial chunk loop (stage times are not '
+                             'reported), "file" sums read, hash, and write '
+                             'times per file, "trace" also records sampled '
+                             'chunks to --trace-file and the metrics',
+                        choices=['off', 'file', 'trace'],
+                        type=str,
+                        default='file')
+    parser.add_argument('--trace-sample',
+                        help='record one chunk in this many with '
+                             '"--instrument trace"; 1 records every chunk',
+                        metavar=f'{Ct.GREEN}<number>{Ct.A}',
+                        type=int,
+                        default=100)
+    parser.add_argument('--trace-file',
+                        help='file to write "--instrument trace" chunk '
+                             'records to as JSON lines',
+                        metavar=f'{Ct.GREEN}<filename>{Ct.A}',
+                        type=str)
     parser.add_argument('--no-color',
                         help='don\'t colorize output',
                         action='store_true')
@@ -147,7 +317,7 @@ def get_args():
     # ~~~ #                 -variables-
     args = parser.parse_args()
 
-    # ~~~ #                 -length and blocksize-
+    # ~~~ #                 -length, blocksize, and workers-
     if args.length < 1 or args.length > 128:
         bp([f'"--length {args.length}" invalid. Length must be between (and '
             'including) 1 and 128.', Ct.RED], err=2)
@@ -157,6 +327,66 @@ def get_args():
             ' (and including) 1 and 1000000.', Ct.RED], err=2)
         sys.exit(1)
 
+    if args.workers < 1 or args.workers > 256:
+        bp([f'"--workers {args.workers}" invalid. Workers must be between '
+            '(and including) 1 and 256.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.walkers < 1 or args.walkers > 256:
+        bp([f'"--walkers {args.walkers}" invalid. Walkers must be between '
+            '(and including) 1 and 256.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.ring < 2 or args.ring > 64:
+        bp([f'"--ring {args.ring}" invalid. Ring must be between (and '
+            'including) 2 and 64.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.val_threads < 1 or args.val_threads > 256:
+        bp([f'"--val-threads {args.val_threads}" invalid. Validation threads'
+            ' must be between (and including) 1 and 256.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.folder_threads < 1 or args.folder_threads > 256:
+        bp([f'"--folder-threads {args.folder_threads}" invalid. Folder '
+            'threads must be between (and including) 1 and 256.', Ct.RED],
+           err=2)
+        sys.exit(1)
+    if args.val_queue < 1:
+        bp([f'"--val-queue {args.val_queue}" invalid. Validation queue must '
+            'be at least 1.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.sync_batch < 1:
+        bp([f'"--sync-batch {args.sync_batch}" invalid. Sync batch must be '
+            'at least 1.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.direct_min < 0:
+        bp([f'"--direct-min {args.direct_min}" invalid. Direct min must be '
+            'at least 0.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.metrics_interval <= 0:
+        bp([f'"--metrics-interval {args.metrics_interval}" invalid. Metrics '
+            'interval must be above 0.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.progress_hz <= 0:
+        bp([f'"--progress-hz {args.progress_hz}" invalid. Progress hz must '
+            'be above 0.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.trace_sample < 1:
+        bp([f'"--trace-sample {args.trace_sample}" invalid. Trace sample '
+            'must be at least 1.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.instrument == 'trace' and not (args.trace_file or
+                                           args.metrics_json or
+                                           args.metrics_prom):
+        bp(['"--instrument trace" needs --trace-file, --metrics-json, or '
+            '--metrics-prom to record to.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.instrument == 'off' and args.auto_block:
+        bp(['"--auto-block" tunes on the per file read and write times, '
+            'which "--instrument off" does not measure.', Ct.RED], err=2)
+        sys.exit(1)
+    if args.buffer_limit < 1:
+        bp([f'"--buffer-limit {args.buffer_limit}" invalid. Buffer limit '
+            'must be at least 1.', Ct.RED], err=2)
+        sys.exit(1)
+
     # ~~~ #                 -hash-
     # create list of available hash algorithms
     hash_list = [i for i in sorted(hashlib.algorithms_guaranteed)]
@@ -173,30 +403,52 @@ def get_args():
                 avail_str += (f'{Ct.RED}{i:<16s}{Ct.A}'
                               f'{getattr(hashlib, i)().block_size:<16}'
                               f'{args.length:<16}{2 * args.length:<16}\n')
+        avail_str += (f'\nTree hashes (Merkle root of {TREE_CHUNK:,} byte '
+                      'chunks hashed in parallel):\n')
+        for i in tree_hashes():
+            avail_str += f'{Ct.RED}{i}{Ct.A}\n'
         bp([avail_str, Ct.BBLUE], num=0)
         sys.exit(0)
+    if args.hash not in hash_list and args.hash not in tree_hashes():
+        bp([f'"--hash {args.hash}" invalid. See --available for the hash '
+            'list.', Ct.RED], err=2)
+        sys.exit(1)
 
     # ~~~ #                 -folder validation-
-    if args.source:
+    # verify only reads the target tree, so it needs no source
+    if args.verify_manifest:
+        if not Path(args.verify_manifest).is_file():
+            bp([f'"--verify-manifest {args.verify_manifest}" does not exist.',
+                Ct.RED], err=2)
+            sys.exit(1)
+    elif args.source:
         folder_validation(args.source, 'source')
     else:
         bp(['source path not provided.', Ct.RED], err=2)
         sys.exit(1)
     if args.target:
-        folder_validation(args.source, 'target')
+        folder_validation(args.target, 'target')
     else:
         bp(['target path not provided.', Ct.RED], err=2)
         sys.exit(1)
+    if args.results_dir:
+        folder_validation(args.results_dir, 'results-dir')
     if args.source == args.target:
         bp(['source and target cannot be the same.', Ct.RED], err=2)
         sys.exit(1)
-    # check if target is empty and confirm overwrite
-    overwrite_check(args.target, 'folder')
+    # check if target is empty and confirm overwrite; sync and resume expect
+    # a target
+    if not args.sync and not args.resume and not args.verify_manifest:
+        overwrite_check(args.target, 'folder')
 
     # ~~~ #                 -log-
     if args.log_file:
         overwrite_check(args.log_file, 'file')
     if args.error_log_file:
         overwrite_check(args.error_log_file, 'file')
+    if args.manifest:
+        overwrite_check(args.manifest, 'file')
+    if args.trace_file:
+        overwrite_check(args.trace_file, 'file')
 
     return args
@@ -0,0 +1,157 @@
+"""blocktune v0.0.1"""
+
+
+import os
+import threading
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.notations import byte_notation
+from modules.options import args, BLOCK_SIZE_FACTOR
+
+
+# ~~~ #        variables
+# chunk sizes the tuner moves between; all powers of two
+TUNE_MIN = 64 * 1024
+TUNE_MAX = 16 * 1024 * 1024
+# every device starts here
+TUNE_START = 1024 * 1024
+# a file must span this many chunks for its throughput to count
+TUNE_CHUNKS = 8
+# files measured before the tuner settles or probes the next size
+TUNE_SAMPLES = 4
+# weight of a new measurement in a size's running throughput
+TUNE_WEIGHT = 0.3
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def pow2_ceil(size: int):
+    """Round up to a power of two.
+
+    - Args:
+        - size (int): the size in bytes
+
+    - Returns:
+        - int: the smallest power of two >= size, at least 1
+    """
+    return 1 << max(0, size - 1).bit_length()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class BlockTuner:
+    """The --auto-block chunk size picker. Each source device has a current
+    size that is hill climbed on measured throughput: after TUNE_SAMPLES
+    files at the current size it probes the next size up or down (in
+    turn), and after TUNE_SAMPLES files at the probe it keeps whichever
+    size had the better running throughput. A file never gets a chunk
+    bigger than itself, and chunks are multiples of the source and target
+    st_blksize.
+
+    - Args:
+        - target (str): the target root folder, for its st_blksize
+    """
+    def __init__(self, target: str):
+        try:
+            self.align = os.stat(target).st_blksize or 4096
+        except (OSError, AttributeError):
+            self.align = 4096
+        self.lock = threading.Lock()
+        # k: st_dev; v: 'size', 'probe', 'up', 'samples', and 'rates'
+        self.devices = {}
+
+    def device(self, st_dev: int):
+        """Get a device's state; must be called holding the lock.
+
+        - Args:
+            - st_dev (int): the device id
+
+        - Returns:
+            - dict: the device state
+        """
+        dev = self.devices.get(st_dev)
+        if dev is None:
+            dev = self.devices[st_dev] = {'size': TUNE_START, 'probe': None,
+                                          'up': False, 'samples': 0,
+                                          'rates': {}}
+        return dev
+
+    def size(self, st: os.stat_result):
+        """Pick the chunk size for one file.
+
+        - Args:
+            - st (os.stat_result): the file's stat
+
+        - Returns:
+            - int: the chunk size in bytes
+        """
+        with self.lock:
+            dev = self.device(st.st_dev)
+            size = dev['probe'] or dev['size']
+        align = max(getattr(st, 'st_blksize', 0) or 4096, self.align)
+        size = min(size, pow2_ceil(st.st_size))
+        return max(align, size - size % align)
+
+    def report(self, st: os.stat_result, size: int, nbytes: int,
+               seconds: float):
+        """Feed back the read and write time of a copied file.
+
+        - Args:
+            - st (os.stat_result): the source stat
+            - size (int): the chunk size the file was copied with
+            - nbytes (int): bytes copied
+            - seconds (float): read plus write time
+        """
+        if nbytes < size * TUNE_CHUNKS or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self.lock:
+            dev = self.device(st.st_dev)
+            last = dev['rates'].get(size)
+            dev['rates'][size] = rate if last is None else \
+                last + (rate - last) * TUNE_WEIGHT
+            dev['samples'] += 1
+            if dev['samples'] < TUNE_SAMPLES:
+                return
+            dev['samples'] = 0
+            if dev['probe']:
+                # keep the probe only if it beat the current size
+                if dev['rates'].get(dev['probe'], 0) > \
+                        dev['rates'].get(dev['size'], 0):
+                    dev['size'] = dev['probe']
+                dev['probe'] = None
+            else:
+                dev['up'] = not dev['up']
+                probe = dev['size'] * 2 if dev['up'] else dev['size'] // 2
+                if TUNE_MIN <= probe <= TUNE_MAX:
+                    dev['probe'] = probe
+        return
+
+    def summary(self):
+        """Print the size each device settled on at verbose 1."""
+        with self.lock:
+            for st_dev, dev in self.devices.items():
+                if not dev['rates']:
+                    continue        # only read from, e.g. for validation
+                bp([f'Auto block: device {st_dev} settled on '
+                    f'{byte_notation(dev["size"], ntn=1)[1]} chunks', Ct.A],
+                   veb=1)
+        return
+
+
+# the shared tuner; None without --auto-block
+tuner = BlockTuner(args.target) if args.auto_block and args.target else None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def block_size(st: os.stat_result):
+    """The read/write chunk size for a file: tuned with --auto-block, else
+    the fixed --blocksize.
+
+    - Args:
+        - st (os.stat_result): the file's stat
+
+    - Returns:
+        - int: the chunk size in bytes
+    """
+    if tuner is None:
+        return args.blocksize * BLOCK_SIZE_FACTOR
+    return tuner.size(st)
@@ -1,12 +1,24 @@
 
 
 from collections import defaultdict as dd
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os
 from pathlib import Path
 import shutil
+import stat
 from betterprint.betterprint import bp
 from betterprint.colortext import Ct
 from modules.timer import perf_timer
 from modules.options import args
+from modules.treemodel import target_path
+
+
+# ~~~ #        variables
+# folders are made and stamped through an open parent folder where the os
+# allows it; full paths are used otherwise (e.g. Windows)
+DIR_FD = {os.mkdir, os.open, os.chmod, os.utime} <= os.supports_dir_fd
+DIR_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0)
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
@@ -21,9 +33,7 @@ def create_folder(folder_source: str):
         - Path: folder_target
     """
     # ~~~ #                 -variables-
-    # need to convert to string to use replace, then back to Path
-    f_target = str(folder_source).replace(args.source, args.target)
-    folder_target = Path(f_target)
+    folder_target = Path(target_path(folder_source))
 
     try:
         # ~~~ #             -folder creation-
@@ -50,50 +60,235 @@ def stat_copy(f_source: str, f_target: str):
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
 @perf_timer
-def folder_stat_reset(success_dict: dict):
-    """After file copies, rerun the stat_copy because on Linux, a file write
-    updates the folder time. This will reset it to the source time.
+def folder_stat_reset(return_dict: dict):
+    """After file copies, set the folder permissions and times, because on
+    Linux a file write updates the folder time. Folders made by folder_logic
+    get the walk's stat, deepest level first and one parent per task on
+    --folder-threads threads; folders made by folder_one (the streaming
+    walk) are copystat'ed one by one.
 
     - Args:
-        - success_dict (dict): a dictionary of all folders created
+        - return_dict (dict): the folder_dict of the created folders
     """
-    for k, v in success_dict.items():
+    for k, v in return_dict['success_dict'].items():
         stat_copy(k, v)
+    levels = folder_levels(return_dict['success_nodes'])
+    with ThreadPoolExecutor(max_workers=args.folder_threads) as pool:
+        with target_root() as root_fd:
+            for level in reversed(levels):
+                for failed in pool.map(stamp_children, level.keys(),
+                                       level.values(),
+                                       [root_fd] * len(level)):
+                    for node, e in failed:
+                        bp([f'folder stat - {target_path(node.source())}\n'
+                            f'\t{e}', Ct.RED], err=2)
     return
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
-@perf_timer
-def folder_logic(dir_dict: dict):
-    """Controller logic for multiple folder creations.
-
-    - Args:
-        - dir_dict (dict): a dictionary of all folders to create. The key is
-                        the folder, the value is the os.stat of the folder.
+def folder_dict():
+    """Create the empty folder results dict filled by folder_one.
 
     - Returns:
-        - dict: return the success and failure stats along with lists of each.
+        - dict: success and failure counts with dicts of each; folders
+                made by folder_logic are listed as their DirNode in
+                'success_nodes' instead of in 'success_dict'
     """
-    # ~~~ #         variable section
-    return_dict = {
+    return {
         'success': 0,
         'success_dict': dd(str),
+        'success_nodes': [],
         'failure': 0,
         'failure_dict': dd(str)
     }
-    # ~~~ #         dictionary iteration section
-    for k, _ in dir_dict.items():
-        # create each folder and get back 0 for success or 1 for failure
-        folder_return = create_folder(k)
-        # populate dict to track success or failure
-        if folder_return[0] == 0:
-            return_dict['success'] += 1
-            return_dict['success_dict'][k] = folder_return[1]
-            stat_copy(k, folder_return[1])
-            bp([f'Created: {folder_return[1]}', Ct.A], num=0, veb=1)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def folder_one(folder: Path, return_dict: dict):
+    """Create one folder, copy its stat, and record the result. Used for each
+    folder by folder_logic and directly by the streaming tree walk.
+
+    - Args:
+        - folder (Path): the source folder
+        - return_dict (dict): a folder_dict to record the result in
+    """
+    # create each folder and get back 0 for success or 1 for failure
+    folder_return = create_folder(folder)
+    # populate dict to track success or failure
+    if folder_return[0] == 0:
+        return_dict['success'] += 1
+        return_dict['success_dict'][folder] = folder_return[1]
+        stat_copy(folder, folder_return[1])
+        bp([f'Created: {folder_return[1]}', Ct.A], num=0, veb=1)
+    else:
+        return_dict['failure'] += 1
+        return_dict['failure_dict'][folder] = folder_return[1]
+        bp([f'Failed!: {folder_return[1]}', Ct.RED], err=2, num=0)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def folder_levels(nodes: list):
+    """Group folders by depth, and within a depth by parent.
+
+    - Args:
+        - nodes (list): DirNodes, each after its parent
+
+    - Returns:
+        - list: per depth from the top, a dict of k: parent DirNode; v: list
+                of its child DirNodes
+    """
+    levels = []
+    for node in nodes:
+        depth = node.rel.count(os.sep) - 1
+        if depth == len(levels):
+            levels.append(dd(list))
+        levels[depth][node.parent].append(node)
+    return levels
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+@contextmanager
+def target_root():
+    """Open the target root folder for the dir_fd calls.
+
+    - Yields:
+        - int: the open folder, or None without DIR_FD
+    """
+    fd = os.open(args.target, DIR_FLAGS) if DIR_FD else None
+    try:
+        yield fd
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def children_run(parent, children: list, root_fd, func):
+    """Open one target parent folder and run func for each child in it.
+
+    - Args:
+        - parent (DirNode): the parent folder
+        - children (list): its child DirNodes
+        - root_fd (int): the open target root; None without DIR_FD
+        - func (function): called with (child name or path, dir_fd
+                           kwargs, child DirNode)
+
+    - Returns:
+        - list: (child DirNode, OSError) of each failure
+    """
+    failed = []
+    try:
+        if DIR_FD:
+            fd = os.open(parent.rel or '.', DIR_FLAGS, dir_fd=root_fd)
+            where, kw = '', {'dir_fd': fd}
         else:
-            return_dict['failure'] += 1
-            return_dict['failure_dict'][k] = folder_return[1]
-            bp([f'Failed!: {folder_return[1]}', Ct.RED], err=2, num=0)
+            fd, where, kw = None, os.path.join(args.target, parent.rel), {}
+    except OSError as e:
+        return [(node, e) for node in children]
+    try:
+        for node in children:
+            try:
+                func(os.path.join(where, node.name), kw, node)
+            except OSError as e:
+                failed.append((node, e))
+    finally:
+        if fd is not None:
+            os.close(fd)
+    return failed
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def child_mkdir(name: str, kw: dict, node):
+    """children_run func: make one folder; an existing folder is fine."""
+    try:
+        os.mkdir(name, **kw)
+    except FileExistsError:
+        if not stat.S_ISDIR(os.stat(name, follow_symlinks=False,
+                                    **kw).st_mode):
+            raise
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def child_stamp(name: str, kw: dict, node):
+    """children_run func: set one folder's mode and times from its walk
+    stat. A symlinked source folder was made as a real folder, so it gets
+    the stat of the folder the link points to."""
+    st = node.st
+    if stat.S_ISLNK(st.st_mode):
+        st = os.stat(node.source())
+    os.chmod(name, stat.S_IMODE(st.st_mode), **kw)
+    os.utime(name, ns=(st.st_atime_ns, st.st_mtime_ns), **kw)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def make_children(parent, children: list, root_fd):
+    """Make the child folders of one parent."""
+    return children_run(parent, children, root_fd, child_mkdir)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def stamp_children(parent, children: list, root_fd):
+    """Set the mode and times of the child folders of one parent."""
+    return children_run(parent, children, root_fd, child_stamp)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def folder_failed(node, return_dict: dict, e):
+    """Record a folder folder_logic could not make.
+
+    - Args:
+        - node (DirNode): the source folder
+        - return_dict (dict): the folder_dict to record it in
+        - e (OSError or str): the reason
+    """
+    folder_target = Path(target_path(node.source()))
+    return_dict['failure'] += 1
+    return_dict['failure_dict'][node.source()] = folder_target
+    bp([f'create folder - {folder_target}\n\t{e}', Ct.RED], err=2)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+@perf_timer
+def folder_logic(tree):
+    """Controller logic for multiple folder creations. The tree is made one
+    level at a time; within a level each parent is a task on
+    --folder-threads threads that makes its children through one open
+    folder. Mode and times are left to folder_stat_reset.
+
+    - Args:
+        - tree (WalkTree): the walked tree
+
+    - Returns:
+        - dict: return the success and failure stats along with lists of each.
+    """
+    # ~~~ #         variable section
+    return_dict = folder_dict()
+    failed_nodes = set()
+    # ~~~ #         level section
+    with ThreadPoolExecutor(max_workers=args.folder_threads) as pool:
+        with target_root() as root_fd:
+            for level in folder_levels(tree.dirs[1:]):
+                # the children of a failed folder fail with it
+                for parent in [z for z in level if z in failed_nodes]:
+                    for node in level.pop(parent):
+                        failed_nodes.add(node)
+                        folder_failed(node, return_dict,
+                                      'its parent folder failed')
+                failed = pool.map(make_children, level.keys(),
+                                  level.values(), [root_fd] * len(level))
+                for children, failures in zip(level.values(), failed):
+                    for node, e in failures:
+                        failed_nodes.add(node)
+                        folder_failed(node, return_dict, e)
+                    for node in children:
+                        if node not in failed_nodes:
+                            return_dict['success'] += 1
+                            return_dict['success_nodes'].append(node)
+                            bp([f'Created: {target_path(node.source())}',
+                                Ct.A], num=0, veb=1)
 
     return return_dict
@@ -0,0 +1,361 @@
+"""engines v0.0.1"""
+
+
+import errno
+import mmap
+import os
+import queue
+import threading
+from time import perf_counter
+import modules.instrument as instrument
+from modules.options import args
+# O_DIRECT is toggled with fcntl, which is posix only
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# ~~~ #        variables
+# errors meaning the filesystem or kernel can't do a zero-copy transfer; any
+# other error is a real I/O failure and is raised to file_multi
+KERNEL_FALLBACK = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL,
+                   errno.EBADF, errno.ETXTBSY, errno.EPERM}
+# minimum bytes hashed per mmap slice; keeps python overhead out of the loop
+MMAP_HASH_MIN = 4000000
+# O_DIRECT buffer address, size, and file offset alignment; covers 512 and
+# 4096 byte logical sectors
+DIRECT_ALIGN = max(4096, mmap.PAGESIZE)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def pipeline_reader(fr, free_q, hash_q, stop, fm_dict: dict):
+    """Pipeline stage 1: fill free ring buffers from the source file.
+
+    - Args:
+        - fr (file): the open source file
+        - free_q (Queue): empty bytearray buffers ready to be filled
+        - hash_q (Queue): filled (buffer, length, read time) items for the
+                          hasher
+        - stop (Event): set by the writer on error to end the read early
+        - fm_dict (dict): the file_multi dict; only file_read_time is updated
+    """
+    try:
+        while True:
+            buf = free_q.get()
+            if stop.is_set():
+                break
+            t_start = perf_counter()
+            length = fr.readinto(buf)
+            t_read = perf_counter() - t_start
+            fm_dict['file_read_time'] += t_read
+            if not length:
+                break
+            hash_q.put((buf, length, t_read))
+    except OSError as e:
+        fm_dict['pipeline_error'] = e
+    hash_q.put(None)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def pipeline_hasher(hlib, hash_q, write_q, fm_dict: dict):
+    """Pipeline stage 2: hash each filled buffer, then pass it to the writer.
+    hashlib releases the GIL on large updates so this overlaps the other two
+    stages.
+
+    - Args:
+        - hlib (hashlib): the hashlib to update
+        - hash_q (Queue): filled (buffer, length, read time) items from the
+                          reader
+        - write_q (Queue): hashed (buffer, length, read time, hash time)
+                           items for the writer
+        - fm_dict (dict): the file_multi dict; only hash_time is updated
+    """
+    while True:
+        item = hash_q.get()
+        if item is None:
+            break
+        with memoryview(item[0]) as mv:
+            t_start = perf_counter()
+            hlib.update(mv[:item[1]])
+            t_hash = perf_counter() - t_start
+            fm_dict['hash_time'] += t_hash
+        write_q.put((*item, t_hash))
+    write_q.put(None)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def pipeline_multi(fr, fw, hlib, fm_dict: dict, file_loops: int,
+                   update_loop: int):
+    """Pipelined read, hash, and write of a single file. A reader thread fills
+    a small ring of buffers while a hasher thread and this (writer) thread
+    work on the buffers before it, so a large file runs at roughly the speed
+    of its slowest stage instead of the sum of all three. Each buffer
+    carries its read and hash times to the writer, which offers the chunk to
+    the tracer once with all three stages.
+
+    - Args:
+        - fr (file): the open source file
+        - fw (file): the open target file; ignored on 'read'
+        - hlib (hashlib): the hashlib to update
+        - fm_dict (dict): the file_multi dict; stage times are added to it
+        - file_loops (int): number of chunks
+        - update_loop (int): publish 'bytes_done' every update_loop chunks
+
+    - Raises:
+        - OSError: any read or write error, after all stages have stopped
+    """
+    # ~~~ #         variable section
+    free_q, hash_q, write_q = queue.Queue(), queue.Queue(), queue.Queue()
+    for _ in range(args.ring):
+        free_q.put(bytearray(fm_dict['read_blocks']))
+    stop = threading.Event()
+    write_error = None
+    file_loop = done = 0
+    stages = [threading.Thread(target=pipeline_reader,
+                               args=(fr, free_q, hash_q, stop, fm_dict)),
+              threading.Thread(target=pipeline_hasher,
+                               args=(hlib, hash_q, write_q, fm_dict))]
+    for stage in stages:
+        stage.start()
+
+    # ~~~ #         writer stage
+    while True:
+        item = write_q.get()
+        if item is None:
+            break
+        buf, length, t_read, t_hash = item
+        t_write = None
+        # after a write error keep draining so the reader can exit
+        if write_error is None and fm_dict['file_action'] == 'copy':
+            try:
+                with memoryview(buf) as mv:
+                    t_start = perf_counter()
+                    fw.write(mv[:length])
+                    t_write = perf_counter() - t_start
+                    fm_dict['file_write_time'] += t_write
+            except OSError as e:
+                write_error = e
+                stop.set()
+        if instrument.tracer:
+            instrument.tracer.chunk(fm_dict, t_read, t_hash, t_write)
+        free_q.put(buf)
+        file_loop += 1
+        done += length
+        if file_loop % update_loop == 0:
+            fm_dict['bytes_done'] = done
+    for stage in stages:
+        stage.join()
+    if write_error is not None:
+        raise write_error
+    if fm_dict.get('pipeline_error') is not None:
+        raise fm_dict.pop('pipeline_error')
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def kernel_copy(fd_in: int, fd_out: int, file_size: int):
+    """Copy a whole file inside the kernel with os.copy_file_range, falling
+    back to os.sendfile. The data never passes through python.
+
+    - Args:
+        - fd_in (int): the source file descriptor, positioned at 0
+        - fd_out (int): the empty target file descriptor
+        - file_size (int): bytes to copy
+
+    - Returns:
+        - bool: True if copied; False if neither call is supported here and
+                nothing was written
+
+    - Raises:
+        - OSError: a real I/O error, or an error after a partial copy
+    """
+    copied = 0
+    calls = []
+    if hasattr(os, 'copy_file_range'):
+        calls.append(lambda left: os.copy_file_range(fd_in, fd_out, left))
+    if hasattr(os, 'sendfile'):
+        calls.append(lambda left: os.sendfile(fd_out, fd_in, None, left))
+    for call in calls:
+        try:
+            while copied < file_size:
+                sent = call(file_size - copied)
+                # 0 means the source shrank; validation will catch it
+                if sent == 0:
+                    break
+                copied += sent
+            return True
+        except OSError as e:
+            if copied > 0 or e.errno not in KERNEL_FALLBACK:
+                raise
+    return False
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def kernel_multi(fr, fw, hlib, fm_dict: dict, file_loops: int,
+                 update_loop: int):
+    """Zero-copy engine: hash the source straight from an mmap memoryview (no
+    per-chunk bytes objects) and move the data with kernel_copy. If the
+    kernel copy is unsupported the mmap slices are written instead. Kernel
+    copy time is reported as file_write_time and mmap hashing (including
+    the page faults that read the file) as hash_time.
+
+    - Args:
+        - fr (file): the open source file
+        - fw (file): the open target file; ignored on 'read'
+        - hlib (hashlib): the hashlib to update
+        - fm_dict (dict): the file_multi dict; stage times are added to it
+        - file_loops (int): number of chunks
+        - update_loop (int): publish 'bytes_done' every update_loop chunks
+
+    - Returns:
+        - bool: False if the file can't be mapped (empty or unsupported) and
+                nothing was done; file_multi then uses the serial engine
+    """
+    # ~~~ #         mmap hash section
+    try:
+        mm = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return False
+    step = max(fm_dict['read_blocks'], MMAP_HASH_MIN)
+    hash_update = max(1, update_loop * fm_dict['read_blocks'] // step)
+    try:
+        if hasattr(mm, 'madvise'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mm) as mv:
+            t_start = perf_counter()
+            for hash_loop, offset in enumerate(range(0, len(mm), step), 1):
+                hlib.update(mv[offset:offset + step])
+                # the copy is one kernel call, so only hashing is published
+                if hash_loop % hash_update == 0:
+                    fm_dict['bytes_done'] = offset + step
+            fm_dict['hash_time'] += perf_counter() - t_start
+
+            # ~~~ #     copy section
+            if fm_dict['file_action'] == 'copy':
+                t_start = perf_counter()
+                if not kernel_copy(fr.fileno(), fw.fileno(), len(mm)):
+                    for offset in range(0, len(mm), step):
+                        fw.write(mv[offset:offset + step])
+                fm_dict['file_write_time'] += perf_counter() - t_start
+    finally:
+        mm.close()
+    return True
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def direct_set(fd: int, on: bool):
+    """Turn O_DIRECT on or off for an open file.
+
+    - Args:
+        - fd (int): the open file descriptor
+        - on (bool): True to set O_DIRECT, False to clear it
+
+    - Returns:
+        - bool: False if the flag was already in that state or the
+                filesystem refused it
+    """
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    if bool(flags & os.O_DIRECT) == on:
+        return False
+    try:
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags ^ os.O_DIRECT)
+    except OSError as e:
+        if e.errno != errno.EINVAL:
+            raise
+        return False
+    return True
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def direct_write(fd: int, chunk):
+    """Write all of chunk to an O_DIRECT file. If the filesystem rejects a
+    direct write (EINVAL), O_DIRECT is cleared and the rest of the file is
+    written through the page cache.
+
+    - Args:
+        - fd (int): the open target file descriptor
+        - chunk (memoryview): the data; aligned except for the file's tail
+    """
+    while chunk:
+        try:
+            chunk = chunk[os.write(fd, chunk):]
+        except OSError as e:
+            if e.errno != errno.EINVAL or not direct_set(fd, False):
+                raise
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def direct_multi(fr, fw, hlib, fm_dict: dict, file_loops: int,
+                 update_loop: int):
+    """Direct I/O engine: write files of at least --direct-min MB with
+    O_DIRECT so the copy doesn't fill the page cache with dirty pages. Reads
+    go into a page aligned anonymous mmap whose size is a multiple of
+    DIRECT_ALIGN, so every chunk but the last is an aligned direct write;
+    the unaligned tail is written with O_DIRECT cleared.
+
+    - Args:
+        - fr (file): the open source file
+        - fw (file): the open target file; written through its descriptor
+        - hlib (hashlib): the hashlib to update
+        - fm_dict (dict): the file_multi dict; stage times are added to it
+        - file_loops (int): number of chunks
+        - update_loop (int): publish 'bytes_done' every update_loop chunks
+
+    - Returns:
+        - bool: False for 'read', small files, or a filesystem that refuses
+                O_DIRECT (e.g. tmpfs), with nothing done; file_multi then
+                uses the serial engine
+    """
+    if fcntl is None or not hasattr(os, 'O_DIRECT') or \
+            fm_dict['file_action'] != 'copy' or \
+            fm_dict['file_size'] < args.direct_min * 1000000:
+        return False
+    fd = fw.fileno()
+    fw.flush()
+    if not direct_set(fd, True):
+        return False
+    size = -(-fm_dict['read_blocks'] // DIRECT_ALIGN) * DIRECT_ALIGN
+    trace = instrument.tracer
+    read_time = hash_time = write_time = 0.0
+    file_loop = 0
+    # ~~~ #         chunk loop section
+    # anonymous maps are page aligned; the view is released before the map
+    # is closed
+    with mmap.mmap(-1, size) as buf, memoryview(buf) as mv:
+        t_last = perf_counter()
+        while True:
+            length = fr.readinto(buf)
+            t_now = perf_counter()
+            t_read = t_now - t_last
+            read_time += t_read
+            t_last = t_now
+            if not length:
+                break
+            with mv[:length] as chunk:
+                hlib.update(chunk)
+                t_now = perf_counter()
+                t_hash = t_now - t_last
+                hash_time += t_hash
+                t_last = t_now
+                # only the last chunk can be unaligned
+                aligned = length - length % DIRECT_ALIGN
+                direct_write(fd, chunk[:aligned])
+                if aligned < length:
+                    direct_set(fd, False)
+                    direct_write(fd, chunk[aligned:])
+            t_now = perf_counter()
+            write_time += t_now - t_last
+            if trace:
+                trace.chunk(fm_dict, t_read, t_hash, t_now - t_last)
+            t_last = t_now
+            file_loop += 1
+            if file_loop % update_loop == 0:
+                fm_dict['bytes_done'] = fr.tell()
+    fm_dict['file_read_time'] += read_time
+    fm_dict['hash_time'] += hash_time
+    fm_dict['file_write_time'] += write_time
+    return True
@@ -11,3 +11,25 @@ def free_space(folder):
     vol_bytes['total_bytes'], vol_bytes['used_bytes'], vol_bytes['free_bytes']\
         = shutil.disk_usage(folder)
     return vol_bytes
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def space_guard(file_iter, vol_bytes):
+    """Pass files through until their total size reaches the free space. For
+    the streaming walk, where the total isn't known up front.
+
+    - Args:
+        - file_iter (iter): (file, os.stat) pairs
+        - vol_bytes (dict): a free_space return; 'exceeded' is set to 1 if
+                            the files stop early
+
+    - Yields:
+        - [tuple]: the same (file, os.stat) pairs
+    """
+    total = 0
+    for file, st in file_iter:
+        total += st.st_size
+        if total >= vol_bytes['free_bytes']:
+            vol_bytes['exceeded'] = 1
+            return
+        yield file, st
@@ -0,0 +1,86 @@
+"""instrument v0.0.1"""
+
+
+from itertools import count
+import json
+import threading
+from time import perf_counter
+import modules.metrics as metrics
+from modules.options import args
+
+
+# ~~~ #        variables
+# the run's --instrument level, one of the arguments.py choices: 'off'
+# makes no timer calls in the serial chunk loop, 'file' sums stage times per
+# file, 'trace' also records every --trace-sample'th chunk. Read on every
+# file, so it can be changed between files
+level = args.instrument
+# the open tracer at 'trace'; None otherwise
+tracer = None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class Tracer:
+    """Sampled per-chunk tracing for --instrument trace. Every sample'th
+    chunk across all threads has its stage times recorded in the metrics
+    chunk histogram (with --metrics-json/--metrics-prom) and as a JSON line
+    in the trace file; the rest only cost a counter step.
+
+    - Args:
+        - file (str): the --trace-file, or None
+        - sample (int): record one chunk in this many
+    """
+    def __init__(self, file: str, sample: int):
+        self.sample = sample
+        self.count = count()
+        self.start = perf_counter()
+        self.lock = threading.Lock()
+        self.f = open(file, 'a', encoding='utf-8', newline='\n') if file \
+            else None
+
+    def chunk(self, fm_dict: dict, read=None, hash=None, write=None):
+        """Offer one chunk's stage times; only the sampled ones are kept.
+        Stages not timed by the caller are left None.
+
+        - Args:
+            - fm_dict (dict): the file_multi dict
+            - read (float, optional): read seconds. Defaults to None.
+            - hash (float, optional): hash seconds. Defaults to None.
+            - write (float, optional): write seconds. Defaults to None.
+        """
+        # next() on a count is atomic, so workers share it without the lock
+        if next(self.count) % self.sample:
+            return
+        stages = {'read': read, 'hash': hash, 'write': write}
+        if metrics.registry:
+            for stage, seconds in stages.items():
+                if seconds is not None:
+                    metrics.registry.chunk(stage, seconds)
+        if self.f:
+            line = json.dumps({'t': perf_counter() - self.start,
+                               'thread': threading.current_thread().name,
+                               'action': fm_dict['file_action'],
+                               'file': str(fm_dict['file_source']),
+                               **stages})
+            with self.lock:
+                self.f.write(f'{line}\n')
+        return
+
+    def close(self):
+        """Flush and close the trace file."""
+        if self.f:
+            with self.lock:
+                self.f.close()
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def tracer_open():
+    """Start tracing for --instrument trace.
+
+    - Returns:
+        - Tracer: the tracer, also kept in instrument.tracer
+    """
+    global tracer
+    tracer = Tracer(args.trace_file, args.trace_sample)
+    return tracer
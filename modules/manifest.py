@@ -0,0 +1,194 @@
+"""manifest v0.0.1"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from time import perf_counter
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.notations import byte_notation
+from modules.options import args, BLOCK_SIZE_FACTOR
+from modules.syncindex import rel_path
+from modules.treehash import hash_new
+
+
+# ~~~ #        variables
+# first line of every manifest; the hash name (and shake length) follow it
+MANIFEST_HEADER = '# vcp manifest'
+# lines written between flushes
+FLUSH_EVERY = 1000
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def path_escape(rel: str):
+    """Escape a path the way sha256sum does: names holding a backslash or
+    newline get both escaped and the line is prefixed with a backslash.
+
+    - Args:
+        - rel (str): the relative path
+
+    - Returns:
+        - [tuple]: 0 = line prefix ('' or '\\'), 1 = the escaped path
+    """
+    if '\\' not in rel and '\n' not in rel:
+        return '', rel
+    return '\\', rel.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def path_unescape(line: str):
+    """Reverse path_escape for one digest line.
+
+    - Args:
+        - line (str): a manifest digest line without the end of line
+
+    - Returns:
+        - [tuple]: 0 = hex digest, 1 = relative path
+    """
+    escaped = line.startswith('\\')
+    hex_str, rel = line[escaped:].split('  ', 1)
+    if escaped:
+        rel = rel.replace('\\n', '\n').replace('\\\\', '\\')
+    return hex_str, rel
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class Manifest:
+    """Streams a sha256sum compatible manifest as files validate. Each file
+    gets a '# size <bytes>' comment line followed by '<hex>  <path>'; the
+    sum tools skip '#' lines, so 'sha256sum -c' still works from the target
+    root.
+
+    - Args:
+        - manifest_file (str): the manifest to append to
+    """
+    def __init__(self, manifest_file: str):
+        self.lines = 0
+        self.f = open(manifest_file, 'a', encoding='utf-8', newline='\n')
+        hash_name = f'{args.hash} {args.length}' if 'shake' in args.hash \
+            else args.hash
+        self.f.write(f'{MANIFEST_HEADER} {hash_name}\n')
+
+    def add(self, file, size: int, hash_hex: str):
+        """Write one validated file.
+
+        - Args:
+            - file (Path): the source file
+            - size (int): the validated size in bytes
+            - hash_hex (str): the validated hash
+        """
+        prefix, rel = path_escape(rel_path(file))
+        self.f.write(f'# size {size}\n{prefix}{hash_hex}  {rel}\n')
+        self.lines += 1
+        if self.lines % FLUSH_EVERY == 0:
+            self.f.flush()
+        return
+
+    def close(self):
+        """Flush and close the manifest."""
+        self.f.close()
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def manifest_read(manifest_file: str):
+    """Parse a manifest written by Manifest (or plain sha256sum output).
+
+    - Args:
+        - manifest_file (str): the manifest to read
+
+    - Returns:
+        - [tuple]: 0 = hash name, 1 = shake length or None, 2 = list of
+                   (relative path, hex digest, size or None)
+    """
+    hash_name, length, entries, size = args.hash, None, [], None
+    with open(manifest_file, 'r', encoding='utf-8', newline='\n') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith(MANIFEST_HEADER):
+                header = line[len(MANIFEST_HEADER):].split()
+                hash_name = header[0]
+                length = int(header[1]) if len(header) > 1 else None
+            elif line.startswith('# size '):
+                size = int(line[7:])
+            elif line and not line.startswith('#'):
+                hex_str, rel = path_unescape(line)
+                entries.append((rel, hex_str, size))
+                size = None
+    return hash_name, length, entries
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def target_check(entry: tuple, hash_name: str, length):
+    """Hash one target file and compare it to its manifest entry.
+
+    - Args:
+        - entry (tuple): (relative path, hex digest, size or None)
+        - hash_name (str): the hashlib algorithm
+        - length (int): the shake digest length or None
+
+    - Returns:
+        - [tuple]: 0 = 'OK', 'FAILED', or 'MISSING'; 1 = bytes read
+    """
+    rel, hex_str, size = entry
+    path = os.path.join(args.target, *rel.split('/'))
+    hlib = hash_new(hash_name)
+    buf = bytearray(args.blocksize * BLOCK_SIZE_FACTOR)
+    read_size = 0
+    try:
+        with open(path, 'rb') as f:
+            # a size mismatch fails without reading the file
+            if size is not None and os.fstat(f.fileno()).st_size != size:
+                return 'FAILED', 0
+            with memoryview(buf) as mv:
+                while True:
+                    chunk = f.readinto(buf)
+                    if not chunk:
+                        break
+                    hlib.update(mv[:chunk])
+                    read_size += chunk
+    except FileNotFoundError:
+        return 'MISSING', 0
+    except OSError as e:
+        bp([f'verify read failure: {path}\n{e}', Ct.RED], err=2)
+        return 'FAILED', read_size
+    digest = hlib.hexdigest(length) if length else hlib.hexdigest()
+    return ('OK' if digest == hex_str.lower() else 'FAILED'), read_size
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def manifest_verify(manifest_file: str):
+    """Re-check the target tree against a manifest using --workers threads;
+    the source isn't needed.
+
+    - Args:
+        - manifest_file (str): the manifest to verify against
+
+    - Returns:
+        - [dict]: counts of 'OK', 'FAILED', and 'MISSING' files, plus
+                  'read_size' and 'time'
+    """
+    t_start = perf_counter()
+    hash_name, length, entries = manifest_read(manifest_file)
+    if 'shake' in hash_name and not length:
+        length = args.length
+    mv_dict = {'OK': 0, 'FAILED': 0, 'MISSING': 0, 'read_size': 0,
+               'time': 0.0}
+    bp([f'Verify {len(entries):,} files ({hash_name}) in {args.target}',
+        Ct.A])
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = pool.map(lambda e: target_check(e, hash_name, length),
+                           entries)
+        for entry, (status, read_size) in zip(entries, results):
+            mv_dict[status] += 1
+            mv_dict['read_size'] += read_size
+            if status == 'OK':
+                bp([f'OK: {entry[0]}', Ct.GREEN], num=0, veb=1)
+            else:
+                bp([f'{status}: {entry[0]}', Ct.RED], err=2, num=0)
+    mv_dict['time'] = perf_counter() - t_start
+    bp([f'\n       OK: {mv_dict["OK"]:>10,}\n   FAILED: '
+        f'{mv_dict["FAILED"]:>10,}\n  MISSING: {mv_dict["MISSING"]:>10,}\n'
+        f'     Read: {byte_notation(mv_dict["read_size"], ntn=1)[1]:>10}\n'
+        f' Duration: {mv_dict["time"]:,.4f}s', Ct.A])
+    return mv_dict
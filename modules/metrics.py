@@ -0,0 +1,344 @@
+"""metrics v0.0.1"""
+
+
+from bisect import bisect_left
+import heapq
+import json
+import os
+import threading
+from time import perf_counter
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.options import args
+
+
+# ~~~ #        variables
+# latency histogram upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 300.0)
+# per-file throughput histogram upper bounds in bytes/s
+RATE_BUCKETS = tuple(z * 1000000 for z in (1, 5, 10, 25, 50, 100, 250, 500,
+                                           1000, 2500, 5000))
+# files smaller than this are all latency, so they skip the throughput one
+RATE_MIN = 1000000
+# slowest files kept for the JSON report
+SLOWEST = 20
+# the run's registry; None without --metrics-json or --metrics-prom
+registry = None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class Metric:
+    """One metric family: a counter, gauge, or histogram, holding a value
+    per label set. Every update takes the family's lock once, so workers can
+    share it.
+
+    - Args:
+        - kind (str): 'counter', 'gauge', or 'histogram'
+        - name (str): the Prometheus metric name
+        - doc (str): the help text
+        - buckets (tuple, optional): histogram upper bounds. Defaults to
+                                     None.
+        - func (function, optional): gauge only; called at export for its
+                                     unlabeled value. Defaults to None.
+    """
+    def __init__(self, kind: str, name: str, doc: str, buckets=None,
+                 func=None):
+        self.kind = kind
+        self.name = name
+        self.doc = doc
+        self.buckets = buckets
+        self.func = func
+        self.lock = threading.Lock()
+        # k: tuple of (label, value) pairs; v: number, or for histograms a
+        # list of per-bucket counts (+Inf last) followed by the sum
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        """Add to a counter or gauge."""
+        key = tuple(labels.items())
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Set a gauge."""
+        with self.lock:
+            self.values[tuple(labels.items())] = value
+
+    def observe(self, value: float, **labels):
+        """Add one observation to a histogram."""
+        key = tuple(labels.items())
+        idx = bisect_left(self.buckets, value)
+        with self.lock:
+            hist = self.values.get(key)
+            if hist is None:
+                hist = self.values[key] = [0] * (len(self.buckets) + 1) + [0]
+            hist[idx] += 1
+            hist[-1] += value
+
+    def samples(self):
+        """Snapshot the family's values for export.
+
+        - Returns:
+            - list: (labels dict, value) pairs; histogram values are dicts of
+                    cumulative 'buckets', 'sum', and 'count'
+        """
+        if self.func is not None:
+            try:
+                return [({}, self.func())]
+            except Exception:
+                return []
+        with self.lock:
+            items = [(dict(k), list(v) if self.buckets else v)
+                     for k, v in self.values.items()]
+        if not self.buckets:
+            return items
+        out = []
+        for labels, hist in items:
+            cumulative, total = {}, 0
+            for bound, count in zip((*self.buckets, '+Inf'), hist):
+                total += count
+                cumulative[str(bound)] = total
+            out.append((labels, {'buckets': cumulative, 'sum': hist[-1],
+                                 'count': total}))
+        return out
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def label_str(labels: dict):
+    """Format labels for the Prometheus text format.
+
+    - Args:
+        - labels (dict): label names and values
+
+    - Returns:
+        - str: '{a="1",b="2"}', or '' with no labels
+    """
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + \
+        '}'
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class Registry:
+    """The run's metrics: the standard vcp families below plus any added
+    with metric(), and the slowest files seen. Files are recorded through
+    file_done, which the copy code calls only when the registry exists, and
+    chunks through chunk, which the --instrument trace tracer calls.
+    """
+    def __init__(self):
+        self.start = perf_counter()
+        self.metrics = {}
+        self.lock = threading.Lock()
+        # min heap of (seconds, action, path, size); the slowest SLOWEST
+        self.slowest = []
+        self.files = self.metric('counter', 'vcp_files_total',
+                                 'files processed by action and result')
+        self.bytes = self.metric('counter', 'vcp_bytes_total',
+                                 'bytes processed by action and device')
+        self.busy = self.metric('counter', 'vcp_device_seconds_total',
+                                'seconds spent on files by action and '
+                                'device')
+        self.file_seconds = self.metric('histogram', 'vcp_file_seconds',
+                                        'per-file latency by action and '
+                                        'device', LATENCY_BUCKETS)
+        self.file_rate = self.metric('histogram',
+                                     'vcp_file_bytes_per_second',
+                                     f'per-file throughput of files of at '
+                                     f'least {RATE_MIN} bytes',
+                                     RATE_BUCKETS)
+        self.chunk_seconds = self.metric('histogram', 'vcp_chunk_seconds',
+                                         'sampled per-chunk read, hash, and '
+                                         'write time (--instrument trace)',
+                                         LATENCY_BUCKETS)
+        self.phase = self.metric('gauge', 'vcp_phase_seconds',
+                                 'duration of each finished phase')
+        self.metric('gauge', 'vcp_bytes_per_second',
+                    'bytes copied per second of run time',
+                    func=lambda: sum(v for k, v in self.bytes.samples() if
+                                     k['action'] == 'copy') / self.elapsed())
+
+    def metric(self, kind: str, name: str, doc: str, buckets=None,
+               func=None):
+        """Get a metric family, creating it on first use.
+
+        - Returns:
+            - Metric: the family
+        """
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Metric(kind, name, doc, buckets, func)
+            return self.metrics[name]
+
+    def elapsed(self):
+        """Seconds since the registry was created."""
+        return perf_counter() - self.start
+
+    def file_done(self, fm_dict: dict, seconds: float):
+        """Record one file_multi return.
+
+        - Args:
+            - fm_dict (dict): the file_multi dict
+            - seconds (float): the file's wall time in file_multi
+        """
+        action = fm_dict['file_action']
+        result = 'failure' if fm_dict['failure'] else 'success'
+        self.files.inc(action=action, result=result)
+        if fm_dict['failure']:
+            return
+        device = str(fm_dict['file_info'].st_dev)
+        size = fm_dict['file_size']
+        self.bytes.inc(size, action=action, device=device)
+        self.busy.inc(seconds, action=action, device=device)
+        self.file_seconds.observe(seconds, action=action, device=device)
+        if size >= RATE_MIN and seconds > 0:
+            self.file_rate.observe(size / seconds, action=action,
+                                   device=device)
+        with self.lock:
+            item = (seconds, action, str(fm_dict['file_source']), size)
+            if len(self.slowest) < SLOWEST:
+                heapq.heappush(self.slowest, item)
+            elif item > self.slowest[0]:
+                heapq.heapreplace(self.slowest, item)
+        return
+
+    def chunk(self, stage: str, seconds: float):
+        """Record one chunk stage.
+
+        - Args:
+            - stage (str): 'read', 'hash', or 'write'
+            - seconds (float): the stage time
+        """
+        self.chunk_seconds.observe(seconds, stage=stage)
+
+    def report(self):
+        """Build the JSON report.
+
+        - Returns:
+            - dict: 'elapsed', 'metrics', 'devices' (bytes, seconds, and
+                    bytes/s per action and device), and 'slowest_files'
+        """
+        metrics = {}
+        for name, metric in list(self.metrics.items()):
+            metrics[name] = {'type': metric.kind, 'help': metric.doc,
+                             'samples': [{'labels': k, 'value': v} for k, v
+                                         in metric.samples()]}
+        busy = {tuple(k.items()): v for k, v in self.busy.samples()}
+        devices = []
+        for labels, nbytes in self.bytes.samples():
+            seconds = busy.get(tuple(labels.items()), 0.0)
+            devices.append(dict(labels, bytes=nbytes, seconds=seconds,
+                                bytes_per_second=nbytes / seconds if seconds
+                                else 0.0))
+        with self.lock:
+            slowest = sorted(self.slowest, reverse=True)
+        return {'elapsed': self.elapsed(), 'metrics': metrics,
+                'devices': devices,
+                'slowest_files': [{'seconds': z[0], 'action': z[1],
+                                   'path': z[2], 'bytes': z[3]}
+                                  for z in slowest]}
+
+    def prometheus(self):
+        """Build the Prometheus text exposition format.
+
+        - Returns:
+            - str: every metric family
+        """
+        lines = []
+        for name, metric in list(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.doc}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, value in metric.samples():
+                if metric.kind != 'histogram':
+                    lines.append(f'{name}{label_str(labels)} {value}')
+                    continue
+                for bound, count in value['buckets'].items():
+                    lines.append(f'{name}_bucket'
+                                 f'{label_str(dict(labels, le=bound))} '
+                                 f'{count}')
+                lines.append(f'{name}_sum{label_str(labels)} {value["sum"]}')
+                lines.append(f'{name}_count{label_str(labels)} '
+                             f'{value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def file_replace(file: str, text: str):
+    """Write a file through a temporary file and rename, so a reader such as
+    the node_exporter textfile collector never sees a partial file.
+
+    - Args:
+        - file (str): the file to write
+        - text (str): the contents
+    """
+    tmp_file = f'{file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    os.replace(tmp_file, file)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def metrics_write():
+    """Write the --metrics-json and --metrics-prom files from the registry."""
+    try:
+        if args.metrics_json:
+            file_replace(args.metrics_json,
+                         json.dumps(registry.report(), indent=2))
+        if args.metrics_prom:
+            file_replace(args.metrics_prom, registry.prometheus())
+    except OSError as e:
+        bp([f'writing metrics: {e}', Ct.YELLOW], err=1)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class MetricsExport:
+    """Rewrites the metrics files every --metrics-interval seconds on a daemon
+    thread for the length of the run, and once more when closed."""
+    def __init__(self):
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Export thread: write, then wait out the interval."""
+        while not self.stop.wait(args.metrics_interval):
+            metrics_write()
+        return
+
+    def close(self):
+        """Stop the thread and write the final files."""
+        self.stop.set()
+        self.thread.join()
+        metrics_write()
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def metrics_open():
+    """Create the registry and start exporting it.
+
+    - Returns:
+        - MetricsExport: call close() at the end of the run
+    """
+    global registry
+    registry = Registry()
+    return MetricsExport()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def phase_done(phase: str, seconds: float):
+    """Record a finished phase's duration; does nothing without a registry.
+
+    - Args:
+        - phase (str): 'walk', 'folders', 'files', or 'stat_reset'
+        - seconds (float): the phase time
+    """
+    if registry:
+        registry.phase.set(seconds, phase=phase)
+    return
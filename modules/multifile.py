@@ -1,111 +1,322 @@
 
 
-from datetime import timedelta
-import hashlib
-from math import ceil
+from concurrent.futures import ThreadPoolExecutor
+import errno
+from functools import partial
+from itertools import islice
+from math import ceil, gcd
+import os
 from pathlib import Path
+import queue
 import shutil
+import stat
+import sys
+import threading
+from time import perf_counter
 from betterprint.betterprint import bp
 from betterprint.colortext import Ct
-from modules.notations import byte_notation
+import modules.blocktune as blocktune
+from modules.engines import direct_multi, kernel_multi, pipeline_multi
+import modules.instrument as instrument
+import modules.metrics as metrics
+from modules.nocache import drop_cache, target_flush
+import modules.progress as progress
+import modules.results as results
+import modules.resume as resume
 from modules.timer import perf_timer
-from modules.options import args, BLOCK_SIZE_FACTOR
+from modules.treehash import hash_new
+from modules.treemodel import target_path
+from modules.options import args
+
+
+# ~~~ #        variables
+# serializes fr_dict updates and the status display across workers
+fr_lock = threading.Lock()
+# holds each worker thread's reusable serial_multi read buffer
+buffer_local = threading.local()
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
-@perf_timer
-def file_read(file_handle, file_blocks):
-    """A simple function to read a part of a file in chunks. It is decorated
-    with a timer to track duration.
+def hash_hex(hlib):
+    """Get the hexadecimal digest of a finished hashlib.
 
     - Args:
-        - file_handle (file): the open file to read
-        - file_blocks (file): the size in bytes to read
+        - hlib (hashlib): the hashlib with every chunk added
 
     - Returns:
-        - [file]: returns the read blocks
+        - str: the hex digest; --length bytes long for 'shake' hashes
     """
-    return file_handle.read(file_blocks)
+    if 'shake' in args.hash:
+        return hlib.hexdigest(args.length)
+    return hlib.hexdigest()
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
 @perf_timer
-def file_write(file_handle, file_blocks):
-    """A simple function to write a part of a file in chunks. It is decorated
-    with a timer to track duration.
+def stat_copy(f_source: str, f_target: str):
+    """Copies the file details (time, permissions) from source to target.
 
     - Args:
-        - file_handle (file): the open file to write
-        - file_blocks (file): the data to write
+        - f_source (str): source file
+        - f_target (str): target file
+    """
+    shutil.copystat(f_source, f_target, follow_symlinks=False)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+@perf_timer
+def stat_fd(fr, fw, st: os.stat_result):
+    """stat_copy for the small file path: xattrs, permissions, and times are
+    set through the open files, with the times and mode taken from the walk
+    stat, so neither path is looked up or stat'ed again.
+
+    - Args:
+        - fr (file): the open source file
+        - fw (file): the open target file
+        - st (os.stat_result): the source stat
 
     - Returns:
-        - [file]: returns the written blocks
+        - bool: False if this platform can't set them through a file, in
+                which case stat_copy has to
     """
-    return file_handle.write(file_blocks)
+    if os.chmod not in os.supports_fd or os.utime not in os.supports_fd:
+        return False
+    # a symlinked source was copied as a regular file, so it gets the stat
+    # of the file the link points to
+    if stat.S_ISLNK(st.st_mode):
+        st = os.fstat(fr.fileno())
+    # times must be set after the last write reaches the file
+    fw.flush()
+    if hasattr(os, 'listxattr'):
+        for name in os.listxattr(fr.fileno()):
+            try:
+                os.setxattr(fw.fileno(), name, os.getxattr(fr.fileno(),
+                                                            name))
+            except OSError as e:
+                # the same errors shutil.copystat ignores
+                if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.ENODATA,
+                                   errno.EINVAL):
+                    raise
+    os.chmod(fw.fileno(), stat.S_IMODE(st.st_mode))
+    os.utime(fw.fileno(), ns=(st.st_atime_ns, st.st_mtime_ns))
+    return True
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
-@perf_timer
-def hash_processing(hash_action, hlib, file_blocks=0):
-    """This hashes a block of a file (or whole file if small enough). The
-    hashlib must be passed back and forth to maintain a single, consistant
-    hashlib to update for files bigger than the block size. This will also
-    generate a hexadecimal output of a hashlib.
+def worker_buffer(size: int):
+    """Get this thread's reusable read buffer, creating it on first use or
+    growing it when a bigger size is requested, so files with different
+    chunk sizes share one buffer.
 
     - Args:
-        - hlib (hashlib): the hashlib to update
-        - hash_action (str): either 'update' to runs hashlib.update or 'hex' to
-                             run hashlib.hexdigest.
-        - file_blocks (int, optional): required for hash_action of 'update';
-                                       the data to hash. Defaults to 0.
+        - size (int): the buffer size in bytes
 
     - Returns:
-        - [hashlib]: for 'update' hash action, returns an updated hashlib
-                     object,for 'hex' hash action, returns a hexadecimal
-                     string.
+        - memoryview: a view of exactly size bytes of the thread's buffer
     """
-    # ~~~ #                 -update-
-    if hash_action == 'update':
-        hash_upd = hlib.update(file_blocks)
-        return hash_upd
-
-    # ~~~ #                 -hex-
-    elif hash_action == 'hex':
-        if 'shake' in args.hash:
-            return hlib.hexdigest(args.length)
+    buf = getattr(buffer_local, 'buf', None)
+    if buf is None or len(buf) < size:
+        buf = buffer_local.buf = bytearray(size)
+    return memoryview(buf)[:size]
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def serial_multi(fr, fw, hlib_var, fm_dict: dict, file_loops: int,
+                 update_loop: int):
+    """Read, hash, and write a single file one chunk at a time. Each chunk is
+    read into the worker's preallocated buffer and hashed and written
+    through a memoryview, so no bytes object is created per chunk. With
+    --instrument off the loop makes no timer calls; otherwise stage times
+    are kept in locals and added to fm_dict once per file, and at 'trace'
+    each chunk is also offered to the tracer.
+
+    - Args:
+        - fr (file): the open source file
+        - fw (file): the open target file; ignored on 'read'
+        - hlib_var (hashlib): the hashlib to update
+        - fm_dict (dict): the file_multi dict; stage times are added to it
+        - file_loops (int): number of chunks
+        - update_loop (int): publish 'bytes_done' every update_loop chunks
+    """
+    # ~~~ #         variable section
+    buf = worker_buffer(fm_dict['read_blocks'])
+    buf_size = len(buf)
+    readinto, update, write = fr.readinto, hlib_var.update, fw.write
+    copy = fm_dict['file_action'] == 'copy'
+    trace = instrument.tracer
+    # the progress display reads 'bytes_done' from its own thread
+    publish = update_loop if progress.display else 0
+    # --resume checkpoints; the target is synced up to each recorded offset
+    checkpoint = max(1, resume.RESUME_EVERY // buf_size) if \
+        resume.journal is not None and copy and \
+        fm_dict['file_size'] >= resume.RESUME_EVERY else 0
+    # the chunk loops only check one modulo for both
+    tick_loop = gcd(publish, checkpoint) or sys.maxsize
+    read_time = hash_time = write_time = 0.0
+    file_loop = 0
+
+    def chunk_tick():
+        """Write a due checkpoint and publish progress."""
+        nonlocal write_time
+        if checkpoint and file_loop % checkpoint == 0:
+            t_start = perf_counter()
+            fw.flush()
+            os.fsync(fw.fileno())
+            resume.journal.partial(fm_dict['file_source'],
+                                   fm_dict['file_info'], fr.tell())
+            write_time += perf_counter() - t_start
+        if publish and file_loop % publish == 0:
+            fm_dict['bytes_done'] = fr.tell()
+
+    # ~~~ #         chunk loop section
+    with memoryview(buf) as mv:
+        if instrument.level == 'off':
+            while True:
+                # read source in blocks to prevent potential memory overload
+                length = readinto(buf)
+                # this breaks the while loop when file chunk is empty
+                if not length:
+                    break
+                # only the final chunk needs a shorter view
+                chunk = mv if length == buf_size else mv[:length]
+                update(chunk)
+                # skip this section on read hashing, otherwise copy the file
+                if copy:
+                    write(chunk)
+                file_loop += 1
+                if file_loop % tick_loop == 0:
+                    chunk_tick()
         else:
-            return hlib.hexdigest()
+            t_last = perf_counter()
+            while True:
+                length = readinto(buf)
+                t_read = perf_counter()
+                read_time += t_read - t_last
+                if not length:
+                    break
+                chunk = mv if length == buf_size else mv[:length]
+                update(chunk)
+                t_hash = perf_counter()
+                hash_time += t_hash - t_read
+                t_write = t_hash
+                if copy:
+                    write(chunk)
+                    t_write = perf_counter()
+                    write_time += t_write - t_hash
+                if trace:
+                    trace.chunk(fm_dict, t_read - t_last, t_hash - t_read,
+                                t_write - t_hash if copy else None)
+                t_last = t_write
+                file_loop += 1
+                if file_loop % tick_loop == 0:
+                    chunk_tick()
+                    t_last = perf_counter()
+    fm_dict['file_read_time'] += read_time
+    fm_dict['hash_time'] += hash_time
+    fm_dict['file_write_time'] += write_time
+    return
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
-@perf_timer
-def stat_copy(f_source: str, f_target: str):
-    """Copies the file details (time, permissions) from source to target.
+def resume_multi(fr, fw, hlib_var, fm_dict: dict, offset: int):
+    """Pick up a partially copied file at its --resume checkpoint. The kept
+    source prefix is read and hashed (a hashlib state can't be saved), and
+    the target is cut back to the checkpoint so serial_multi can copy the
+    rest from there.
 
     - Args:
-        - f_source (str): source file
-        - f_target (str): target file
+        - fr (file): the open source file
+        - fw (file): the target file, opened 'r+b'
+        - hlib_var (hashlib): the hashlib to update
+        - fm_dict (dict): the file_multi dict; stage times are added to it
+        - offset (int): the checkpointed offset
     """
-    shutil.copystat(f_source, f_target, follow_symlinks=False)
+    buf = worker_buffer(fm_dict['read_blocks'])
+    with memoryview(buf) as mv:
+        while fr.tell() < offset:
+            t_start = perf_counter()
+            length = fr.readinto(mv[:min(len(buf), offset - fr.tell())])
+            t_read = perf_counter()
+            if not length:
+                break
+            hlib_var.update(mv[:length])
+            fm_dict['file_read_time'] += t_read - t_start
+            fm_dict['hash_time'] += perf_counter() - t_read
+    fw.seek(fr.tell())
+    fw.truncate()
+    bp([f'Resumed at {fr.tell():,} bytes: {fm_dict["file_source"]}',
+        Ct.A], num=0, veb=1)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def small_multi(fr, fw, hlib_var, fm_dict: dict):
+    """Read, hash, and write a file smaller than one chunk with a single call
+    each and no progress published. A file that has grown to a full chunk since
+    it was stat'ed is finished by serial_multi.
+
+    - Args:
+        - fr (file): the open source file
+        - fw (file): the open target file; ignored on 'read'
+        - hlib_var (hashlib): the hashlib to update
+        - fm_dict (dict): the file_multi dict; stage times are added to it
+    """
+    buf = worker_buffer(fm_dict['read_blocks'])
+    copy = fm_dict['file_action'] == 'copy'
+    # --instrument off skips the timer calls
+    timed = instrument.level != 'off'
+    t_start = perf_counter() if timed else 0.0
+    length = fr.readinto(buf)
+    t_read = perf_counter() if timed else 0.0
+    with memoryview(buf) as mv, mv[:length] as chunk:
+        hlib_var.update(chunk)
+        t_hash = perf_counter() if timed else 0.0
+        if copy:
+            fw.write(chunk)
+    t_write = perf_counter() if timed else 0.0
+    fm_dict['file_read_time'] += t_read - t_start
+    fm_dict['hash_time'] += t_hash - t_read
+    fm_dict['file_write_time'] += t_write - t_hash
+    if instrument.tracer:
+        instrument.tracer.chunk(fm_dict, t_read - t_start, t_hash - t_read,
+                                t_write - t_hash if copy else None)
+    # the size compared at validation is what was actually hashed
+    fm_dict['file_size'] = length
+    if length == len(buf):
+        file_loops = ceil(os.fstat(fr.fileno()).st_size / length)
+        serial_multi(fr, fw, hlib_var, fm_dict, file_loops,
+                     1 if file_loops < 100 else int(file_loops / 100))
+        fm_dict['file_size'] = fr.tell()
     return
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
-def file_multi(file_action: str, file_source: Path):
-    """The main file read, write, and validation actions run from here.
+def file_multi(file_action: str, file_source: Path, st=None):
+    """The main file read, write, and validation actions run from here. Files
+    smaller than one chunk take small_multi, and on 'copy' get their stat
+    applied here while they are still open.
 
     - Args:
         - file_action (str): either 'copy' or 'read'
         - file_source (str): the file to copy or read
+        - st (os.stat_result, optional): the stat from the tree walk; the
+                                         file is stat'ed if None. Defaults
+                                         to None.
     - Returns:
-        - [tuple]: 12 k/v pair dict of actions taken, status, and output
+        - [tuple]: 14 k/v pair dict of actions taken, status, and output;
+                   'stat_time' is None unless the stat was applied here, and
+                   'bytes_done' is the progress last published by the engine
     """
     # ~~~ #         variable section
+    t_file = perf_counter()
     # this var must be passed to other functions and back to maintain integrity
-    hlib_var = (getattr(hashlib, args.hash)())
-    # need to convert to string to use replace, then back to Path
+    hlib_var = hash_new(args.hash)
+    if st is None:
+        st = os.stat(file_source, follow_symlinks=False)
     f_source = str(file_source)
-    f_target = f_source.replace(args.source, args.target)
+    # a read is of the target itself
+    f_target = target_path(f_source) if file_action == 'copy' else f_source
     # dict to hold various updates for single return var
     fm_dict = {
         'failure': 0,
@@ -114,194 +325,554 @@ def file_multi(file_action: str, file_source: Path):
         'short_source': (f_source if len(f_source) < 63 else
                          f'...{f_source[(len(f_source) - 60):]}'),
         'file_target': Path(f_target),
-        'read_blocks': args.blocksize * BLOCK_SIZE_FACTOR,
-        'file_info': file_source.stat(follow_symlinks=False),
-        'file_size': file_source.stat(follow_symlinks=False).st_size,
+        'read_blocks': blocktune.block_size(st),
+        'file_info': st,
+        'file_size': st.st_size,
         'file_read_time': 0.0,
         'file_write_time': 0.0,
         'hash_time': 0.0,
-        'hash_hex': ''
+        'hash_hex': '',
+        'stat_time': None,
+        'bytes_done': 0
     }
-    file_loop = 0
+    small = fm_dict['file_size'] < fm_dict['read_blocks']
     # number of loops to execute
     file_loops = ceil(fm_dict['file_size'] / fm_dict['read_blocks'])
     # limit cli output to max of 100 loops to prevent slowdown
     update_loop = 1 if file_loops < 100 else int(file_loops / 100)
     # target open variable prevents overwriting target on read actions
     target_open = 'wb' if file_action == 'copy' else 'rb'
+    # a --resume checkpoint keeps the target's copied prefix
+    offset = resume.journal.offset(file_source, st) if resume.journal and \
+        file_action == 'copy' and not small else 0
+    if offset:
+        target_open = 'r+b'
+    if progress.display:
+        progress.display.file_open(fm_dict)
     # ~~~ #         file manipulation section
     try:
         # fr is file read, fw is file write; fw is opened but ignored on 'read'
         with open(fm_dict['file_source'], 'rb') as fr,\
              open(fm_dict['file_target'], target_open) as fw:
-            while True:
-                # read source in blocks to prevent potential memory overload
-                f_chunk = file_read(fr, fm_dict['read_blocks'])
-                fm_dict['file_read_time'] += f_chunk[1]
-                # this breaks the while loop when file chunk is empty
-                if not f_chunk[2]:
-                    # bp([f'Source: {fm_dict["file_source"]}\nTarget: '
-                    #     f'{fm_dict["file_target"]}', Ct.A], con=0)
-                    break
-                # update the hash on each chunk
-                hash_return = hash_processing('update', hlib_var, f_chunk[2])
-                fm_dict['hash_time'] += hash_return[1]
-                # skip this section on read hashing, otherwise copy the file
-                if file_action == 'copy':
-                    write_return = file_write(fw, f_chunk[2])
-                    fm_dict['file_write_time'] += write_return[1]
-                # loop and stdout print a status of the current file processing
-                file_loop += 1
-                if file_loop % update_loop == 0:
-                    bp([f'\u001b[1000D{(file_loop / file_loops) * 100:.0f}%',
-                        Ct.BBLUE, ' | ', Ct.A, f'{fm_dict["short_source"]}',
-                        Ct.GREEN], log=0, inl=1, num=0, fls=1, fil=0, veb=1)
-            bp(['', Ct.A], fil=0, veb=1)
-            hash_return = hash_processing('hex', hlib_var)
-            fm_dict['hash_time'] += hash_return[1]
-            fm_dict['hash_hex'] = hash_return[2]
-        return fm_dict
+            # drop the just written (and flushed) pages so validation reads
+            # the media instead of the page cache
+            if args.val_nocache and file_action == 'read':
+                drop_cache(fr.fileno())
+            # the chunk loop, progress, and engine setup are all per-file
+            # overhead for a file that fits in one chunk
+            if small:
+                small_multi(fr, fw, hlib_var, fm_dict)
+            # only the serial engine can start part way into a file
+            elif offset:
+                resume_multi(fr, fw, hlib_var, fm_dict, offset)
+                serial_multi(fr, fw, hlib_var, fm_dict, file_loops,
+                             update_loop)
+            # pipelined stages pay off once there is more than one chunk
+            elif args.engine == 'pipeline' and file_loops > 1:
+                pipeline_multi(fr, fw, hlib_var, fm_dict, file_loops,
+                               update_loop)
+            else:
+                engine = {'kernel': kernel_multi,
+                          'direct': direct_multi}.get(args.engine)
+                # these return False when they can't take the file
+                if engine is None or not engine(fr, fw, hlib_var, fm_dict,
+                                                file_loops, update_loop):
+                    serial_multi(fr, fw, hlib_var, fm_dict, file_loops,
+                                 update_loop)
+            # keep a multi-TB run from evicting everyone else's cache
+            if args.val_nocache:
+                drop_cache(fr.fileno())
+            t_hex = perf_counter()
+            fm_dict['hash_hex'] = hash_hex(hlib_var)
+            fm_dict['hash_time'] += perf_counter() - t_hex
+            if blocktune.tuner and file_action == 'copy' and not offset:
+                blocktune.tuner.report(st, fm_dict['read_blocks'],
+                                       fm_dict['file_size'],
+                                       fm_dict['file_read_time'] +
+                                       fm_dict['file_write_time'])
+            if small and file_action == 'copy':
+                # on failure file_copy falls back to stat_copy and reports it
+                try:
+                    stat_return = stat_fd(fr, fw, st)
+                    if stat_return[2]:
+                        fm_dict['stat_time'] = stat_return[1]
+                except OSError:
+                    pass
 
     except OSError as e:
         bp([f'with file {file_action}: {file_source}\n{e}', Ct.RED], err=2)
         fm_dict['failure'] = 1
-        return fm_dict
+    if progress.display:
+        progress.display.file_close(fm_dict)
+    if metrics.registry:
+        metrics.registry.file_done(fm_dict, perf_counter() - t_file)
+    return fm_dict
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class BufferBudget:
+    """Caps the read buffer bytes held by all workers at once. Each file takes
+    its share before it is handed to a worker and gives it back when the
+    worker is done, so a slow target can't pile up unbounded reads.
 
+    - Args:
+        - limit (int): the max bytes that can be held at once
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, size: int):
+        """Block until size bytes are free, then take them.
+
+        - Args:
+            - size (int): bytes requested; capped at the limit so a single
+                          buffer bigger than the limit can still run alone
+
+        - Returns:
+            - int: the bytes actually taken; pass this back to release
+        """
+        size = min(size, self.limit)
+        with self.cond:
+            while self.used + size > self.limit:
+                self.cond.wait()
+            self.used += size
+        return size
+
+    def release(self, size: int):
+        """Give back bytes taken by acquire and wake any waiting files.
+
+        - Args:
+            - size (int): the value returned by acquire
+        """
+        with self.cond:
+            self.used -= size
+            self.cond.notify_all()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class ValStage:
+    """Validation as its own pipeline stage. Copied files are queued here and
+    validated by separate threads while the copy side moves on to the next
+    file, so target reads overlap source reads. The queue is bounded so the
+    copy side waits if validation falls behind.
+
+    - Args:
+        - file_done (function): called with (file, cv_dict) once validated
+        - threads (int): number of validation threads
+        - maxsize (int): max copied files waiting for validation
+        - batch (int): files validated per target flush; 1 without
+                       --val-nocache
+    """
+    def __init__(self, file_done, threads: int, maxsize: int, batch: int):
+        self.file_done = file_done
+        self.batch = batch
+        self.queue = queue.Queue(maxsize)
+        self.threads = [threading.Thread(target=self.run, daemon=True)
+                        for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, file: Path, cv_dict: dict):
+        """Queue a file_copy return; blocks while the queue is full."""
+        self.queue.put((file, cv_dict))
+
+    def close(self):
+        """Wait for every queued file to be validated and stop the threads."""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def run(self):
+        """Validation thread: take up to batch files, flush them if requested,
+        then validate and hand each to file_done."""
+        running = True
+        while running:
+            batch = []
+            while len(batch) < self.batch:
+                item = self.queue.get()
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            if args.val_nocache:
+                batch_flush([cv_dict for _, cv_dict in batch])
+            for file, cv_dict in batch:
+                try:
+                    file_validate(cv_dict)
+                except Exception as e:
+                    bp([f'validation failure: {file}\n{e}', Ct.RED], err=2)
+                self.file_done(file, cv_dict)
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def batch_flush(cv_list: list):
+    """Flush the successfully copied targets in a batch of file_copy returns
+    to the media with one target_flush.
 
-def file_logic(file_dict: dict, stats_dict: dict):
+    - Args:
+        - cv_list (list): file_copy returns not yet validated
+    """
+    if target_flush(args.target, [cv_dict['copy']['file_target']
+                                  for cv_dict in cv_list
+                                  if cv_dict['copy']['failure'] == 0]):
+        bp(['batch not flushed; validation may read cached pages.',
+            Ct.YELLOW], err=1, con=0 if args.quiet else 1)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def file_overlap():
+    """Check if file stages run at the same time, in which case their summed
+    times are more than the wall time and can't be used as a duration. With
+    --instrument off they aren't all measured, so the same applies.
+
+    - Returns:
+        - bool: True with --workers above 1, --overlap, or --instrument off
+    """
+    return args.workers > 1 or args.overlap or instrument.level == 'off'
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def buffer_need(st):
+    """The read buffer bytes a file holds while it is being copied.
+
+    - Args:
+        - st (os.stat_result): the source file stat
+
+    - Returns:
+        - int: one chunk for the serial engine, a full ring for 'pipeline'
+    """
+    read_blocks = blocktune.block_size(st)
+    if args.engine == 'pipeline' and st.st_size > read_blocks:
+        return read_blocks * args.ring
+    return max(min(st.st_size, read_blocks), 1)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def file_batches(file_items, size: int):
+    """Split the files into lists of up to size files.
+
+    - Args:
+        - file_items (iter): (file, os.stat) pairs to copy
+        - size (int): files per batch
+
+    - Yields:
+        - list: the next batch of (file, os.stat) pairs
+    """
+    file_iter = iter(file_items)
+    while True:
+        batch = list(islice(file_iter, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def file_validate(cv_dict: dict):
+    """Validate a copied file by reading back and hashing the target.
+
+    - Args:
+        - cv_dict (dict): a file_copy return
+
+    - Returns:
+        - [dict]: the same cv_dict with 'val' set; left None if the copy
+                  failed
+    """
+    if cv_dict['copy']['failure'] == 0:
+        cv_dict['val'] = file_multi('read', cv_dict['copy']['file_target'])
+    return cv_dict
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def file_copy(file: Path, st=None, validate=True):
+    """Copy, stat, and validate a single file. This is the unit of work handed
+    to each worker, so it must not touch fr_dict.
+
+    - Args:
+        - file (Path): the source file
+        - st (os.stat_result, optional): the stat from the tree walk.
+                                         Defaults to None.
+        - validate (bool, optional): False leaves validation to a later
+                                     file_validate call. Defaults to True.
+
+    - Returns:
+        - [dict]: 'copy' and 'val' file_multi returns, plus 'stat_time'
+    """
+    cv_dict = {'copy': file_multi('copy', file, st), 'stat_time': 0.0,
+               'val': None}
+    if cv_dict['copy']['failure'] == 0:
+        # ~~~ #         file stat section
+        # the small file path has already applied it in file_multi
+        if cv_dict['copy']['stat_time'] is not None:
+            cv_dict['stat_time'] = cv_dict['copy']['stat_time']
+        else:
+            try:
+                stat_return = stat_copy(file,
+                                        cv_dict['copy']['file_target'])
+                cv_dict['stat_time'] = stat_return[1]
+            except OSError as e:
+                bp([f'with file stat: {file}\n{e}', Ct.RED], err=2)
+        # ~~~ #         file validation section
+        if validate:
+            file_validate(cv_dict)
+    return cv_dict
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def failure_tally(fr_dict: dict, key: str, file: Path):
+    """Count a failure; only the first results.FAILURE_KEEP files are kept
+    in its list, the results store has the rest.
+
+    - Args:
+        - fr_dict (dict): the file_logic results dict
+        - key (str): 'failure' or 'val_failure'
+        - file (Path): the failed file
+    """
+    fr_dict[key] += 1
+    if len(fr_dict[f'{key}_list']) < results.FAILURE_KEEP:
+        fr_dict[f'{key}_list'].append(file)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def copy_tally(fr_dict: dict, file: Path, copy_return: dict, c_tmp: int):
+    """Add a file_multi copy return to the fr_dict counters; a failure is
+    recorded in the results store.
+
+    - Args:
+        - fr_dict (dict): the file_logic results dict
+        - file (Path): the source file
+        - copy_return (dict): the file_multi('copy') return
+        - c_tmp (int): console output for errors; 0 in quiet mode
+    """
+    if copy_return['failure'] == 0:
+        fr_dict['success'] += 1
+        fr_dict['read_time'] += copy_return['file_read_time']
+        fr_dict['write_time'] += copy_return['file_write_time']
+        fr_dict['hash_time'] += copy_return['hash_time']
+        fr_dict['read_size'] += copy_return['file_size']
+        bp([f'Copied: {file}', Ct.GREEN], num=0, veb=1)
+    elif copy_return['failure'] == 1:
+        failure_tally(fr_dict, 'failure', file)
+        results.store.add(file, None, copy_return['file_size'],
+                          results.COPY_FAILED)
+        bp([f'Failed Copy!: {file}', Ct.RED], err=2, con=c_tmp)
+    else:
+        bp([f'Unknown return: {copy_return["failure"]}.\n'
+            f'{copy_return}', Ct.RED], err=2, num=0, con=c_tmp)
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def val_tally(fr_dict: dict, file: Path, copy_return: dict, val_return,
+              c_tmp: int):
+    """Compare the source and target hashes and add the result to fr_dict
+    and the results store.
+
+    - Args:
+        - fr_dict (dict): the file_logic results dict
+        - file (Path): the source file
+        - copy_return (dict): the file_multi('copy') return
+        - val_return (dict): the file_multi('read') return; None if the copy
+                             failed and validation was skipped
+        - c_tmp (int): console output for errors; 0 in quiet mode
+
+    - Returns:
+        - int: 0 is validated; 1 is failure
+    """
+    if copy_return['failure'] == 0 and val_return and \
+            val_return['failure'] == 0:
+        fr_dict['val_read_time'] += val_return['file_read_time']
+        fr_dict['val_hash_time'] += val_return['hash_time']
+        if copy_return['hash_hex'] == val_return['hash_hex'] and\
+                copy_return['file_size'] == val_return['file_size']:
+            fr_dict['val_success'] += 1
+            fr_dict['val_size'] += val_return['file_size']
+            results.store.add(file, copy_return['file_target'],
+                              val_return['file_size'], results.VALIDATED,
+                              copy_return['hash_hex'], val_return['hash_hex'])
+            bp(['Validated: source & target hex match.\n\t', Ct.GREEN,
+                f'{copy_return["hash_hex"]}\n\t{val_return["hash_hex"]}',
+                Ct.A], num=0, veb=1)
+            return 0
+        else:
+            failure_tally(fr_dict, 'val_failure', val_return['file_target'])
+            results.store.add(file, val_return['file_target'],
+                              copy_return['file_size'],
+                              results.HASH_MISMATCH, copy_return['hash_hex'],
+                              val_return['hash_hex'])
+            bp([f'Source & target hex DO NOT MATCH!\n\t'
+                f'{copy_return["hash_hex"]}\n\t{val_return["hash_hex"]}',
+                Ct.RED], err=2, num=0, con=c_tmp)
+    else:
+        failure_tally(fr_dict, 'val_failure', copy_return['file_target'])
+        # a failed copy is already in the store
+        if copy_return['failure'] == 0:
+            results.store.add(file, copy_return['file_target'],
+                              copy_return['file_size'],
+                              results.TARGET_UNREAD, copy_return['hash_hex'])
+        bp(['Failed reading copied file!: ', Ct.RED,
+            f'{copy_return["file_target"]}', Ct.RED], err=2, con=c_tmp)
+    return 1
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def file_logic(file_dict: dict, stats_dict: dict, sync_index=None,
+               manifest=None):
     """The controller for the file_multi section. This initiates copies and
-    validates the returns.
+    validates the returns. With --workers above 1 the files are run through a
+    thread pool, and with --overlap validation runs in its own ValStage;
+    fr_dict is updated under fr_lock and drawn by the progress thread.
 
     Args:
-        file_dict (dict): dict of files as keys and os.stat list as values
+        file_dict (dict): dict of files as keys and os.stat list as values,
+                          or an iterable of (file, os.stat) pairs such as
+                          a WalkTree or the streaming walk
+        stats_dict (dict): the tree walk stats; read again on each progress
+                           draw, so a counting pass can still be filling it
+                           in
+        sync_index (SyncIndex, optional): records each validated file for
+                                          --sync. Defaults to None.
+        manifest (Manifest, optional): streams each validated file to the
+                                       --manifest. Defaults to None.
 
     Returns:
-        [dict]: 18 k/v pairs on the results of all actions taken
+        [dict]: 14 k/v pairs on the results of all actions taken; the
+                per-file results are in results.store
     """
     # ~~~ #             variables section
-    num_files = stats_dict["num_files"]
-    size_files = stats_dict["file_size"]
+    file_items = file_dict.items() if isinstance(file_dict, dict) else \
+        file_dict
     # sets console output variable according to requested quiet variable
     c_tmp = 0 if args.quiet else 1
-    # total duration var only used here
-    t_var = 0
+    wall_start = perf_counter()
     fr_dict = {
         'success': 0,
-        'success_source_list': [],
-        'success_target_list': [],
         'failure': 0,
         'failure_list': [],
         'read_time': 0.0,
         'write_time': 0.0,
         'hash_time': 0.0,
-        'hash_source_list': [],
         'read_size': 0,
         'val_success': 0,
-        'val_success_list': [],
         'val_failure': 0,
         'val_failure_list': [],
         'val_read_time': 0.0,
         'val_hash_time': 0.0,
-        'val_hash_list': [],
-        'val_size': 0
+        'val_size': 0,
+        'wall_time': 0.0
     }
+
+    def file_done(file: Path, cv_dict: dict):
+        """Tally one file_copy return."""
+        with fr_lock:
+            copy_tally(fr_dict, file, cv_dict['copy'], c_tmp)
+            fr_dict['write_time'] += cv_dict['stat_time']
+            if val_tally(fr_dict, file, cv_dict['copy'], cv_dict['val'],
+                         c_tmp) == 0:
+                if sync_index:
+                    sync_index.record(file, cv_dict['copy']['file_info'],
+                                      cv_dict['copy']['hash_hex'])
+                if resume.journal:
+                    resume.journal.record(file, cv_dict['copy']['file_info'],
+                                          cv_dict['copy']['hash_hex'])
+                if manifest:
+                    manifest.add(file, cv_dict['val']['file_size'],
+                                 cv_dict['val']['hash_hex'])
+        return
+
     # ~~~ #             file processing section
-    # set initial space if verbose = 0
-    if args.verbose == 0:
-        bp(['Copy files...\n'
-            '  Processed: ', Ct.A, '0', Ct.BBLUE, '/', Ct.A,
-            f'{num_files}\n', Ct.BBLUE, '    Success: ', Ct.A, '0', Ct.BBLUE,
-            '/', Ct.A, f'{num_files}\n', Ct.BBLUE, '    Failure: ', Ct.A,
-            '0', Ct.BBLUE, '/', Ct.A, f'{num_files}\n', Ct.BBLUE,
-            ' Val. Files: ', Ct.A, '0', Ct.BBLUE, '/', Ct.A, f'{num_files}',
-            Ct.BBLUE, '\n     Size: ', Ct.A, '0', Ct.BBLUE, '/', Ct.A,
-            f'{size_files}', Ct.BBLUE, '\n   Duration: ', Ct.A, '00:00:00',
-            Ct.BBLUE, '\n Total Time: ', Ct.A, '00:00:00\n', Ct.BBLUE,
-            'Total Speed: ', Ct.A, '0\n', Ct.BBLUE], log=0, inl=1, num=0,
-            fil=0)
-    for file in file_dict:
-        # ~~~ #         file copy section
-        # set 6 row status since file copies hidden
-        copy_return = file_multi('copy', file)
-        if copy_return['failure'] == 0:
-            fr_dict['success'] += 1
-            fr_dict['success_source_list'].append(file)
-            fr_dict['read_time'] += copy_return['file_read_time']
-            fr_dict['write_time'] += copy_return['file_write_time']
-            fr_dict['hash_time'] += copy_return['hash_time']
-            fr_dict['hash_source_list'].append(copy_return['hash_hex'])
-            fr_dict['success_target_list'].append(copy_return['file_target'])
-            fr_dict['read_size'] += copy_return['file_size']
-            bp([f'Copied: {file}', Ct.GREEN], num=0, veb=1)
-        elif copy_return['failure'] == 1:
-            fr_dict['failure'] += 1
-            fr_dict['failure_list'].append(file)
-            bp([f'Failed Copy!: {file}', Ct.RED], err=2, con=c_tmp)
+    progress.display = progress.Progress(fr_dict, stats_dict)
+    try:
+        # with --overlap copies are handed to the validation stage instead
+        if args.overlap:
+            val_stage = ValStage(file_done, args.val_threads, args.val_queue,
+                                 args.sync_batch if args.val_nocache else 1)
+            copy_done, validate = val_stage.put, False
+            if metrics.registry:
+                metrics.registry.metric('gauge', 'vcp_val_queue_depth',
+                                        'copied files waiting for validation',
+                                        func=val_stage.queue.qsize)
         else:
-            bp([f'Unknown return: {copy_return["failure"]}.\n'
-                f'{copy_return}', Ct.RED], err=2, num=0, con=c_tmp)
-        # interim update for processed, success, and failure
-        if args.verbose == 0:
-            bp(['\u001b[100D\u001b[8A', Ct.A], log=0, inl=1, num=0, fil=0)
-            # bp(['', Ct.A], log=0, inl=1, num=0, fil=0)
-            bp(['  Processed: ', Ct.A,
-                f'{fr_dict["success"] + fr_dict["failure"]}', Ct.BBLUE, '/',
-                Ct.A, f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0, fil=0)
-            bp(['    Success: ', Ct.A, f'{fr_dict["success"]}', Ct.BBLUE, '/',
-                Ct.A, f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0, fil=0)
-            bp(['    Failure: ', Ct.A, f'{fr_dict["failure"]}', Ct.BBLUE, '/',
-                Ct.A, f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0, fil=0)
-        # ~~~ #         file stat section
-        stat_return = stat_copy(file, copy_return['file_target'])
-        fr_dict['write_time'] += stat_return[1]
-        # ~~~ #         file validation section
-        val_return = file_multi('read', copy_return['file_target'])
-        if copy_return['failure'] == 0 and val_return['failure'] == 0:
-            fr_dict['val_read_time'] += val_return['file_read_time']
-            fr_dict['val_hash_time'] += val_return['hash_time']
-            fr_dict['val_hash_list'].append(val_return['hash_hex'])
-            if copy_return['hash_hex'] == val_return['hash_hex'] and\
-                    copy_return['file_size'] == val_return['file_size']:
-                fr_dict['val_success'] += 1
-                fr_dict['val_success_list'].append(val_return['hash_hex'])
-                fr_dict['val_size'] += val_return['file_size']
-                bp(['Validated: source & target hex match.\n\t', Ct.GREEN,
-                    f'{copy_return["hash_hex"]}\n\t{val_return["hash_hex"]}',
-                    Ct.A], num=0, veb=1)
-            else:
-                fr_dict['val_failure'] += 1
-                fr_dict['val_failure_list'].append(val_return["file_target"])
-                bp([f'Source & target hex DO NOT MATCH!\n\t'
-                    f'{copy_return["hash_hex"]}\n\t{val_return["hash_hex"]}',
-                    Ct.RED], err=2, num=0, con=c_tmp)
+            val_stage = None
+            copy_done, validate = file_done, True
+        if args.val_nocache and not args.overlap:
+            # copy a batch, flush it to the media once, then validate it
+            pool = ThreadPoolExecutor(max_workers=args.workers)
+            run = pool.map if args.workers > 1 else map
+            try:
+                for batch in file_batches(file_items, args.sync_batch):
+                    files = [file for file, _ in batch]
+                    cv_list = list(run(partial(file_copy, validate=False),
+                                       files, [st for _, st in batch]))
+                    batch_flush(cv_list)
+                    for file, cv_dict in zip(files, run(file_validate,
+                                                        cv_list)):
+                        file_done(file, cv_dict)
+                pool.shutdown(wait=True)
+            except KeyboardInterrupt:
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+        elif args.workers == 1:
+            for file, st in file_items:
+                copy_done(file, file_copy(file, st, validate))
         else:
-            fr_dict['val_failure'] += 1
-            fr_dict['val_failure_list'].append(copy_return['file_target'])
-            bp(['Failed reading copied file!: ',
-                f'{copy_return["file_target"]}', Ct.RED], err=2, con=c_tmp)
-        # interim update for alidated, size, and duration
-        t_var = (fr_dict['read_time'] + fr_dict['write_time'] +
-                 fr_dict['hash_time'] + fr_dict['val_read_time'] +
-                 fr_dict['val_hash_time'])
-        sp_var = fr_dict["val_size"] / t_var
-        tot_var = size_files / sp_var
-        td_t_var = timedelta(seconds=ceil(t_var))
-        td_tot_var = timedelta(seconds=ceil(tot_var))
-        if args.verbose == 0:
-            bp([' Val. Files: ', Ct.A, f'{fr_dict["val_success"]}', Ct.BBLUE,
-                '/', Ct.A, f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0,
-                fil=0)
-            bp(['\u001b[100D  Val. Size: ', Ct.A,
-                f'{byte_notation(fr_dict["val_size"], ntn=1)[1]}', Ct.BBLUE,
-                '/', Ct.A, f'{byte_notation(size_files, ntn=1)[1]}        ',
-                Ct.BBLUE], inl=0, log=0, num=0, fil=0)
-            bp(['\u001b[100D   Duration: ', Ct.A, f'{td_t_var}      ',
-                Ct.BBLUE], inl=0, log=0, num=0, fil=0)
-            bp(['\u001b[100D Total Time: ', Ct.A, f'{td_tot_var}      ',
-                Ct.BBLUE], inl=0, log=0, num=0, fil=0)
-            bp(['\u001b[100DTotal Speed: ', Ct.A,
-                f'{byte_notation(int(sp_var), ntn=1)[1]}',
-                Ct.BBLUE, '/s      ', Ct.A], inl=0, log=0, num=0, fil=0, fls=1)
+            budget = BufferBudget(args.buffer_limit * 1000000)
+            # bounds queued files so huge trees are not all submitted up front
+            pending = threading.BoundedSemaphore(args.workers * 2)
+            in_flight = None
+            if metrics.registry:
+                metrics.registry.metric('gauge', 'vcp_buffer_bytes',
+                                        'read buffer bytes held by workers',
+                                        func=lambda: budget.used)
+                in_flight = metrics.registry.metric(
+                    'gauge', 'vcp_files_in_flight',
+                    'files handed to workers and not yet done')
+
+            def worker_done(future, file: Path, held: int):
+                """Future callback: pass the file on and free its budget."""
+                try:
+                    copy_done(file, future.result())
+                except Exception as e:
+                    with fr_lock:
+                        failure_tally(fr_dict, 'failure', file)
+                        results.store.add(file, None, 0, results.COPY_FAILED)
+                    bp([f'worker failure: {file}\n{e}', Ct.RED], err=2,
+                       con=c_tmp)
+                finally:
+                    budget.release(held)
+                    pending.release()
+                    if in_flight:
+                        in_flight.inc(-1)
+                return
+
+            pool = ThreadPoolExecutor(max_workers=args.workers)
+            try:
+                for file, st in file_items:
+                    pending.acquire()
+                    held = budget.acquire(buffer_need(st))
+                    if in_flight:
+                        in_flight.inc()
+                    future = pool.submit(file_copy, file, st, validate)
+                    future.add_done_callback(
+                        partial(worker_done, file=file, held=held))
+                pool.shutdown(wait=True)
+            except KeyboardInterrupt:
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+        if val_stage:
+            val_stage.close()
+    finally:
+        # stop drawing before the summary, or the Ctrl+C message
+        progress.display.close()
+        progress.display = None
+    if blocktune.tuner:
+        blocktune.tuner.summary()
     if args.verbose == 0:
         bp(['', Ct.A], fil=0)
+    fr_dict['wall_time'] = perf_counter() - wall_start
     return fr_dict
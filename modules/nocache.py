@@ -0,0 +1,65 @@
+"""nocache v0.0.1"""
+
+
+import ctypes
+import os
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+
+
+# ~~~ #        variables
+# syncfs isn't in the os module; None if libc doesn't have it
+try:
+    libc_syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+except (AttributeError, OSError):
+    libc_syncfs = None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def drop_cache(fd: int):
+    """Ask the kernel to drop the cached pages of an open file. Dirty pages
+    can't be dropped, so targets must be flushed with target_flush first.
+
+    - Args:
+        - fd (int): the open file descriptor
+    """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass        # advice only; some filesystems don't support it
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def target_flush(target_root: str, target_list: list):
+    """Flush a batch of copied files to the target media so their pages can
+    be dropped before validation. One syncfs covers the whole batch; if
+    syncfs isn't available each file is fsync'd instead.
+
+    - Args:
+        - target_root (str): any path on the target filesystem
+        - target_list (list): the target files in this batch
+
+    - Returns:
+        - int: 0 if flushed; 1 if anything failed to flush
+    """
+    if libc_syncfs is not None and target_list:
+        fd = os.open(target_root, os.O_RDONLY)
+        try:
+            if libc_syncfs(fd) == 0:
+                return 0
+        finally:
+            os.close(fd)
+    failure = 0
+    for target in target_list:
+        try:
+            fd = os.open(target, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            bp([f'flush failure: {target}\n{e}', Ct.RED], err=2)
+            failure = 1
+    return failure
@@ -0,0 +1,173 @@
+"""pathfilter v0.0.1"""
+
+
+import re
+import sys
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.options import args
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def glob_regex(pattern: str):
+    """Translate one glob to a regex for the '/' separated relative path.
+    '*' and '?' stay inside one path part, '**' crosses parts. A glob with no
+    '/' matches that name at any depth; one with a '/' (or a leading '/')
+    is anchored to the source root.
+
+    - Args:
+        - pattern (str): the glob
+
+    - Returns:
+        - str: the regex, to be used with fullmatch
+    """
+    anchored = '/' in pattern.rstrip('/')
+    pattern = pattern.strip('/')
+    regex, idx = '', 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if pattern.startswith('**/', idx):
+            regex += '(?:.*/)?'
+            idx += 3
+            continue
+        if pattern.startswith('**', idx):
+            regex += '.*'
+            idx += 2
+            continue
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[' and ']' in pattern[idx + 2:]:
+            end = pattern.index(']', idx + 2)
+            body = pattern[idx + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            regex += f'[{body.replace(chr(92), chr(92) * 2)}]'
+            idx = end
+        else:
+            regex += re.escape(char)
+        idx += 1
+    return regex if anchored else f'(?:.*/)?{regex}'
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def pattern_compile(patterns: list):
+    """Compile a list of patterns into a single regex. Entries starting with
+    're:' are regexes against the whole relative path; the rest are globs.
+
+    - Args:
+        - patterns (list): the pattern strings
+
+    - Returns:
+        - re.Pattern: the combined pattern, or None if the list is empty
+    """
+    parts = []
+    for pattern in patterns:
+        if pattern.startswith('re:'):
+            parts.append(pattern[3:])
+        else:
+            parts.append(glob_regex(pattern))
+    if not parts:
+        return None
+    try:
+        return re.compile('|'.join(f'(?:{part})' for part in parts))
+    except re.error as e:
+        bp([f'invalid filter pattern: {e}', Ct.RED], err=2)
+        sys.exit(1)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def pattern_file(filter_file: str):
+    """Read patterns from a file: one per line, '#' comments and blank lines
+    skipped. A pattern ending in '/' applies to folders only.
+
+    - Args:
+        - filter_file (str): the pattern file
+
+    - Returns:
+        - [tuple]: 0 = folder patterns, 1 = file patterns
+    """
+    dir_list, file_list = [], []
+    try:
+        with open(filter_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                if line.endswith('/') and not line.startswith('re:'):
+                    dir_list.append(line)
+                else:
+                    file_list.append(line)
+    except OSError as e:
+        bp([f'filter file failure: {filter_file}\n{e}', Ct.RED], err=2)
+        sys.exit(1)
+    return dir_list, file_list
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class PathFilter:
+    """The compiled --exdir/--exfile/--exclude-from/--include-from matcher.
+    Each kind is one regex built once, tested against the path relative to
+    the source root, so the walk can skip an excluded folder without ever
+    opening it.
+
+    - Args:
+        - exdir (list): folder exclusion patterns
+        - exfile (list): file exclusion patterns
+        - include (list): file inclusion patterns; if given, only files that
+                          match one are copied
+    """
+    def __init__(self, exdir: list, exfile: list, include: list):
+        self.exdir = pattern_compile(exdir)
+        self.exfile = pattern_compile(exfile)
+        self.include = pattern_compile(include)
+
+    def dir_skip(self, rel: str):
+        """Check if a folder (and everything under it) is excluded.
+
+        - Args:
+            - rel (str): the '/' separated path relative to the source root
+
+        - Returns:
+            - bool: True to prune the folder
+        """
+        return self.exdir is not None and \
+            self.exdir.fullmatch(rel) is not None
+
+    def file_skip(self, rel: str):
+        """Check if a file is excluded or not included.
+
+        - Args:
+            - rel (str): the '/' separated path relative to the source root
+
+        - Returns:
+            - bool: True to skip the file
+        """
+        if self.exfile is not None and self.exfile.fullmatch(rel):
+            return True
+        return self.include is not None and \
+            self.include.fullmatch(rel) is None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def filter_args():
+    """Build the PathFilter from the cli args.
+
+    - Returns:
+        - PathFilter: the compiled filter
+    """
+    exdir = args.exdir.split(',') if args.exdir else []
+    exfile = args.exfile.split(',') if args.exfile else []
+    include = []
+    if args.exclude_from:
+        file_dirs, file_files = pattern_file(args.exclude_from)
+        exdir += file_dirs
+        exfile += file_files
+    if args.include_from:
+        include_dirs, include_files = pattern_file(args.include_from)
+        # an included folder includes every file under it
+        include += [f'{"" if "/" in z.strip("/") else "**/"}'
+                    f'{z.strip("/")}/**' for z in include_dirs]
+        include += include_files
+    return PathFilter(exdir, exfile, include)
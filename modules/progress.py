@@ -0,0 +1,170 @@
+"""progress v0.0.1"""
+
+
+from collections import deque
+from datetime import timedelta
+from math import ceil
+import sys
+import threading
+from time import perf_counter
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.notations import byte_notation
+from modules.options import args
+
+
+# ~~~ #        variables
+# seconds between plain progress lines off a terminal or when verbose
+PLAIN_SECS = 10.0
+# seconds of samples the live speed is averaged over
+LIVE_SECS = 5.0
+# rows in the terminal status block
+STATUS_ROWS = 10
+# the running file_logic display; None outside file_logic
+display = None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def eta_str(seconds: float):
+    """Format a duration for the display.
+
+    - Args:
+        - seconds (float): the duration; None if unknown
+
+    - Returns:
+        - str: h:mm:ss, or '--:--:--' if unknown
+    """
+    if seconds is None:
+        return '--:--:--'
+    return str(timedelta(seconds=ceil(seconds)))
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class Progress:
+    """The file_logic progress display, drawn from its own thread so workers
+    only update counters. On a terminal at verbose 0 the status block is
+    redrawn --progress-hz times a second; otherwise (redirected output or
+    verbose per-file lines) a plain line is printed every PLAIN_SECS, unless
+    --quiet.
+
+    Work is counted in bytes through both stages, copy and validation, so a
+    file is half done once copied. Files still in progress count with the
+    'bytes_done' their engine last published.
+
+    - Args:
+        - fr_dict (dict): the file_logic results dict; read, never written
+        - stats_dict (dict): the tree walk stats; read on every draw, so a
+                             counting pass can still be filling it in
+    """
+    def __init__(self, fr_dict: dict, stats_dict: dict):
+        self.fr_dict = fr_dict
+        self.stats_dict = stats_dict
+        # k: id of a file_multi dict; v: the dict, while the file is open
+        self.active = {}
+        self.status = sys.stdout.isatty() and args.verbose == 0
+        self.start = perf_counter()
+        # (time, work bytes) pairs covering the last LIVE_SECS
+        self.samples = deque([(self.start, 0)])
+        self.stop = threading.Event()
+        if args.verbose == 0:
+            bp(['Copy files...', Ct.A], log=0, fil=0)
+        if self.status:
+            bp(['\n' * (STATUS_ROWS - 1), Ct.A], log=0, num=0, fil=0)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def file_open(self, fm_dict: dict):
+        """Start showing a file's published progress."""
+        self.active[id(fm_dict)] = fm_dict
+
+    def file_close(self, fm_dict: dict):
+        """Stop; the file is in the fr_dict totals from here on."""
+        self.active.pop(id(fm_dict), None)
+
+    def run(self):
+        """Renderer thread: draw until closed."""
+        if not self.status and args.quiet:
+            return
+        interval = 1 / args.progress_hz if self.status else PLAIN_SECS
+        while not self.stop.wait(interval):
+            self.draw()
+        return
+
+    def close(self):
+        """Stop the renderer and draw the final totals once."""
+        self.stop.set()
+        self.thread.join()
+        if self.status:
+            self.draw()
+        return
+
+    def rates(self):
+        """Work done so far and the speeds and ETA shown.
+
+        - Returns:
+            - dict: 'elapsed', 'speed' (validated bytes/s over the run),
+                    'live' (source bytes/s over the last LIVE_SECS), and 'eta'
+                    (seconds, or None until there is a live speed)
+        """
+        fr_dict = self.fr_dict
+        now = perf_counter()
+        in_flight = sum(z.get('bytes_done', 0) for z in
+                        list(self.active.values()))
+        work = fr_dict['read_size'] + fr_dict['val_size'] + in_flight
+        self.samples.append((now, work))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= LIVE_SECS:
+            self.samples.popleft()
+        t_then, work_then = self.samples[0]
+        # each source byte is worked on twice: copied and validated
+        live = (work - work_then) / 2 / (now - t_then) if now > t_then else 0
+        remaining = self.stats_dict['file_size'] * 2 - work
+        elapsed = now - self.start
+        return {'elapsed': elapsed,
+                'speed': fr_dict['val_size'] / elapsed if elapsed else 0,
+                'live': live,
+                'eta': max(0.0, remaining / 2 / live) if live > 0 else None}
+
+    def draw(self):
+        """Redraw the status block, or print one plain line."""
+        fr_dict, num_files = self.fr_dict, self.stats_dict['num_files']
+        size_files = self.stats_dict['file_size']
+        rate = self.rates()
+        done = fr_dict['success'] + fr_dict['failure']
+        if not self.status:
+            bp([f'Progress: {done:,}/{num_files:,} files | '
+                f'{byte_notation(fr_dict["val_size"], ntn=1)[1]}/'
+                f'{byte_notation(size_files, ntn=1)[1]} validated | '
+                f'{byte_notation(int(rate["live"]), ntn=1)[1]}/s | ETA '
+                f'{eta_str(rate["eta"])}', Ct.A], num=0)
+            return
+        bp([f'\u001b[100D\u001b[{STATUS_ROWS}A', Ct.A], log=0, inl=1, num=0,
+           fil=0)
+        bp(['  Processed: ', Ct.A, f'{done}', Ct.BBLUE, '/', Ct.A,
+            f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0, fil=0)
+        bp(['    Success: ', Ct.A, f'{fr_dict["success"]}', Ct.BBLUE, '/',
+            Ct.A, f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0, fil=0)
+        bp(['    Failure: ', Ct.A, f'{fr_dict["failure"]}', Ct.BBLUE, '/',
+            Ct.A, f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0, fil=0)
+        bp([' Val. Files: ', Ct.A, f'{fr_dict["val_success"]}', Ct.BBLUE,
+            '/', Ct.A, f'{num_files}', Ct.BBLUE], inl=0, log=0, num=0,
+            fil=0)
+        bp(['\u001b[100D  Val. Size: ', Ct.A,
+            f'{byte_notation(fr_dict["val_size"], ntn=1)[1]}', Ct.BBLUE,
+            '/', Ct.A, f'{byte_notation(size_files, ntn=1)[1]}        ',
+            Ct.BBLUE], inl=0, log=0, num=0, fil=0)
+        bp(['\u001b[100D   Duration: ', Ct.A,
+            f'{eta_str(rate["elapsed"])}      ', Ct.BBLUE], inl=0, log=0,
+           num=0, fil=0)
+        bp(['\u001b[100D        ETA: ', Ct.A, f'{eta_str(rate["eta"])}      ',
+            Ct.BBLUE], inl=0, log=0, num=0, fil=0)
+        bp(['\u001b[100DTotal Speed: ', Ct.A,
+            f'{byte_notation(int(rate["speed"]), ntn=1)[1]}', Ct.BBLUE,
+            '/s      ', Ct.A], inl=0, log=0, num=0, fil=0)
+        bp(['\u001b[100D Live Speed: ', Ct.A,
+            f'{byte_notation(int(rate["live"]), ntn=1)[1]}', Ct.BBLUE,
+            '/s      ', Ct.A], inl=0, log=0, num=0, fil=0)
+        bp(['\u001b[100D    Current: ', Ct.A,
+            f'{len(self.active)} files open      ', Ct.BBLUE], inl=0, log=0,
+           num=0, fil=0, fls=1)
+        return
+
@@ -0,0 +1,177 @@
+"""results v0.0.1"""
+
+
+import os
+import sqlite3
+import tempfile
+import threading
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.options import args
+
+
+# ~~~ #        variables
+# result status of each file
+VALIDATED, COPY_FAILED, HASH_MISMATCH, TARGET_UNREAD = 0, 1, 2, 3
+STATUS_TEXT = {COPY_FAILED: 'copy failed',
+               HASH_MISMATCH: 'hash mismatch',
+               TARGET_UNREAD: 'target read failed'}
+# rows buffered before they are written to the store
+COMMIT_EVERY = 1000
+# failed files kept in the fr_dict failure lists; the store has them all
+FAILURE_KEEP = 100
+# failure report lines shown on the console; the log file gets them all
+REPORT_SHOW = 50
+# the run's open store; None outside a run
+store = None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def hex_bytes(hash_hex: str):
+    """Pack a hex digest into its raw bytes for the store.
+
+    - Args:
+        - hash_hex (str): the hex digest; '' or None if not hashed
+
+    - Returns:
+        - bytes: the digest, or None if not hashed
+    """
+    return bytes.fromhex(hash_hex) if hash_hex else None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class ResultStore:
+    """Per-file results of the run in a scratch sqlite file, so memory stays
+    flat however many files are copied: source, target, size, status, and
+    both digests as raw bytes. Rows are buffered and written COMMIT_EVERY at
+    a time. The summary counts and the failure report are read back from it;
+    the file is removed on close.
+
+    - Args:
+        - folder (str): the folder to make the store in
+    """
+    def __init__(self, folder: str):
+        fd, self.file = tempfile.mkstemp(prefix='vcp_results_', suffix='.db',
+                                         dir=folder)
+        os.close(fd)
+        self.lock = threading.Lock()
+        self.rows = []
+        self.conn = sqlite3.connect(self.file, check_same_thread=False)
+        # scratch data for this run only; nothing to recover after a crash
+        self.conn.execute('PRAGMA journal_mode=OFF')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute('CREATE TABLE results (source TEXT, target TEXT, '
+                          'size INTEGER, status INTEGER, source_hash BLOB, '
+                          'target_hash BLOB)')
+
+    def add(self, source, target, size: int, status: int, source_hex=None,
+            target_hex=None):
+        """Record one file's result.
+
+        - Args:
+            - source (Path): the source file
+            - target (Path): the target file; None if never made
+            - size (int): the size in bytes
+            - status (int): VALIDATED, COPY_FAILED, HASH_MISMATCH, or
+                            TARGET_UNREAD
+            - source_hex (str, optional): source hex digest. Defaults to None.
+            - target_hex (str, optional): target hex digest. Defaults to None.
+        """
+        row = (str(source), None if target is None else str(target), size,
+               status, hex_bytes(source_hex), hex_bytes(target_hex))
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) >= COMMIT_EVERY:
+                self.write()
+        return
+
+    def write(self):
+        """Write the buffered rows; must be called holding the lock."""
+        self.conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                              self.rows)
+        self.conn.commit()
+        self.rows = []
+        return
+
+    def summary(self):
+        """Count the results by status.
+
+        - Returns:
+            - [dict]: k: status; v: (files, bytes)
+        """
+        with self.lock:
+            self.write()
+            return {status: (files, size) for status, files, size in
+                    self.conn.execute('SELECT status, COUNT(*), '
+                                      'TOTAL(size) FROM results GROUP BY '
+                                      'status')}
+
+    def failures(self):
+        """Stream the failed files in the order they were recorded.
+
+        - Yields:
+            - [tuple]: (source, target, status, source hex, target hex)
+        """
+        with self.lock:
+            self.write()
+        cursor = self.conn.execute('SELECT source, target, status, '
+                                   'source_hash, target_hash FROM results '
+                                   f'WHERE status != {VALIDATED} ORDER BY '
+                                   'rowid')
+        for source, target, status, source_hash, target_hash in cursor:
+            yield (source, target, status,
+                   source_hash.hex() if source_hash else '',
+                   target_hash.hex() if target_hash else '')
+
+    def close(self):
+        """Close and remove the store."""
+        with self.lock:
+            self.conn.close()
+        try:
+            os.remove(self.file)
+        except OSError as e:
+            bp([f'removing the results store {self.file}\n{e}', Ct.RED],
+               err=1)
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def store_open():
+    """Open the results store for this run in --results-dir.
+
+    - Returns:
+        - ResultStore: the open store, also kept in results.store
+    """
+    global store
+    store = ResultStore(args.results_dir or tempfile.gettempdir())
+    return store
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def failure_report(result_store: ResultStore):
+    """Print every failed file from the store. The console shows the first
+    REPORT_SHOW; the log file gets them all.
+
+    - Args:
+        - result_store (ResultStore): the run's store
+
+    - Returns:
+        - int: the number of failed files
+    """
+    failed = 0
+    for source, target, status, source_hex, target_hex in \
+            result_store.failures():
+        if failed == 0:
+            bp(['Failed Files:', Ct.RED])
+        con = 1 if failed < REPORT_SHOW else 0
+        # an unreadable target is reported by its own path
+        bp([f'  {STATUS_TEXT[status]}: ', Ct.A,
+            f'{target if status == TARGET_UNREAD else source}', Ct.RED],
+           num=0, con=con)
+        if status == HASH_MISMATCH:
+            bp([f'\t{source_hex}\n\t{target_hex}', Ct.A], num=0, con=con)
+        failed += 1
+    if failed > REPORT_SHOW:
+        bp([f'  ... {failed - REPORT_SHOW:,} more', Ct.A]
+           + ([' in the log file', Ct.A] if args.log_file else []), fil=0)
+    return failed
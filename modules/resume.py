@@ -0,0 +1,202 @@
+"""resume v0.0.1"""
+
+
+import json
+import os
+import threading
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.options import args
+from modules.syncindex import rel_path
+
+
+# ~~~ #        variables
+# the journal lives in the target root next to the --sync index
+JOURNAL_NAME = '.vcp_journal'
+# serial engine bytes copied between partial offset checkpoints
+RESUME_EVERY = 1000000000
+# finished file records written between journal fsyncs
+FSYNC_EVERY = 1000
+# the open --resume journal; None when not resuming
+journal = None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class Journal:
+    """The append-only --resume journal: one JSON line per validated file
+    (path, size, mtime_ns, hash) and per partial offset checkpoint of a large
+    file. It is read back and compacted when opened, so a restarted run can
+    skip finished files and continue partial ones. A torn last line from a
+    crash is ignored. It has the same unchanged/record interface as
+    SyncIndex, so sync_filter and sync_stream work with either.
+
+    - Args:
+        - target (str): the target root folder
+    """
+    def __init__(self, target: str):
+        self.target = target
+        self.file = os.path.join(target, JOURNAL_NAME)
+        self.hash_name = f'{args.hash}:{args.length}' if 'shake' in \
+            args.hash else args.hash
+        self.lock = threading.Lock()
+        self.pending = 0
+        # k: relative path; v: the latest record for it
+        self.done, self.part = {}, {}
+        self.load()
+        self.compact()
+        self.f = open(self.file, 'a', encoding='utf-8', newline='\n')
+
+    def load(self):
+        """Read the records left by earlier runs; later lines win."""
+        try:
+            with open(self.file, 'r', encoding='utf-8', newline='\n') as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue        # torn write from a crash
+                    if rec['type'] == 'done':
+                        self.done[rec['path']] = rec
+                        self.part.pop(rec['path'], None)
+                    else:
+                        self.part[rec['path']] = rec
+        except FileNotFoundError:
+            pass
+        return
+
+    def compact(self):
+        """Rewrite the journal with only the latest record per file. The new
+        journal is synced before it replaces the old one."""
+        tmp_file = f'{self.file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8', newline='\n') as f:
+            for rec in (*self.done.values(), *self.part.values()):
+                f.write(f'{json.dumps(rec)}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.file)
+        return
+
+    def write(self, rec: dict, sync: bool):
+        """Append one record; must be called holding the lock.
+
+        - Args:
+            - rec (dict): the record
+            - sync (bool): True to fsync the journal now
+        """
+        self.f.write(f'{json.dumps(rec)}\n')
+        self.f.flush()
+        self.pending += 1
+        if sync or self.pending >= FSYNC_EVERY:
+            os.fsync(self.f.fileno())
+            self.pending = 0
+        return
+
+    def target_size(self, rel: str):
+        """Get the size of a target file.
+
+        - Args:
+            - rel (str): the relative path
+
+        - Returns:
+            - int: the size in bytes, or -1 if it can't be stat'ed
+        """
+        try:
+            return os.stat(os.path.join(self.target, rel),
+                           follow_symlinks=False).st_size
+        except OSError:
+            return -1
+
+    def unchanged(self, file, st: os.stat_result):
+        """Check if a source file was finished by an earlier run and hasn't
+        changed since.
+
+        - Args:
+            - file (Path): the source file
+            - st (os.stat_result): the source file's stat
+
+        - Returns:
+            - bool: True if the file can be skipped
+        """
+        rel = rel_path(file)
+        rec = self.done.get(rel)
+        if rec is None or (rec['size'], rec['mtime_ns'], rec['hash_name']) \
+                != (st.st_size, st.st_mtime_ns, self.hash_name):
+            return False
+        return self.target_size(rel) == st.st_size
+
+    def record(self, file, st: os.stat_result, hash_hex: str):
+        """Record a validated file.
+
+        - Args:
+            - file (Path): the source file
+            - st (os.stat_result): the source stat taken when it was copied
+            - hash_hex (str): the validated hash
+        """
+        rec = {'type': 'done', 'path': rel_path(file), 'size': st.st_size,
+               'mtime_ns': st.st_mtime_ns, 'hash_name': self.hash_name,
+               'hash': hash_hex}
+        with self.lock:
+            self.done[rec['path']] = rec
+            self.part.pop(rec['path'], None)
+            self.write(rec, False)
+        return
+
+    def partial(self, file, st: os.stat_result, offset: int):
+        """Record how far a large file has been copied. The target must
+        already be synced up to offset.
+
+        - Args:
+            - file (Path): the source file
+            - st (os.stat_result): the source stat
+            - offset (int): bytes copied and synced so far
+        """
+        rec = {'type': 'part', 'path': rel_path(file), 'size': st.st_size,
+               'mtime_ns': st.st_mtime_ns, 'offset': offset}
+        with self.lock:
+            self.part[rec['path']] = rec
+            self.write(rec, True)
+        return
+
+    def offset(self, file, st: os.stat_result):
+        """Get the offset to continue a partially copied file from.
+
+        - Args:
+            - file (Path): the source file
+            - st (os.stat_result): the source file's stat
+
+        - Returns:
+            - int: the checkpointed offset, or 0 to copy from the start
+        """
+        rel = rel_path(file)
+        rec = self.part.get(rel)
+        if rec is None or (rec['size'], rec['mtime_ns']) != \
+                (st.st_size, st.st_mtime_ns) or \
+                self.target_size(rel) < rec['offset']:
+            return 0
+        return rec['offset']
+
+    def close(self):
+        """Flush, sync, and close the journal."""
+        with self.lock:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def journal_open(target: str):
+    """Open the --resume journal for this run.
+
+    - Args:
+        - target (str): the target root folder
+
+    - Returns:
+        - Journal: the open journal, also kept in resume.journal
+    """
+    global journal
+    journal = Journal(target)
+    if journal.done or journal.part:
+        bp([f'Resume - journal has {len(journal.done):,} finished and '
+            f'{len(journal.part):,} partial files', Ct.A])
+    return journal
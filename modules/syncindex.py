@@ -0,0 +1,151 @@
+"""syncindex v0.0.1"""
+
+
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from betterprint.betterprint import bp
+from betterprint.colortext import Ct
+from modules.options import args
+
+
+# ~~~ #        variables
+# the index lives in the target root so it travels with the copy
+INDEX_NAME = '.vcp_index.db'
+# records written between commits
+COMMIT_EVERY = 1000
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def rel_path(file) -> str:
+    """Get a source file's path relative to the source root.
+
+    - Args:
+        - file (Path): the source file
+
+    - Returns:
+        - str: the relative path, using '/' on every platform
+    """
+    return Path(file).relative_to(args.source).as_posix()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class SyncIndex:
+    """The on-disk record of every file validated by earlier runs: relative
+    path, size, mtime_ns, inode, and hash. A file whose source stat still
+    matches its record (and whose target still exists at that size) is
+    skipped without being read.
+
+    - Args:
+        - target (str): the target root folder
+    """
+    def __init__(self, target: str):
+        self.target = target
+        self.hash_name = f'{args.hash}:{args.length}' if 'shake' in \
+            args.hash else args.hash
+        self.pending = 0
+        # the streaming walk checks files while workers record them
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(target, INDEX_NAME),
+                                    check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT '
+                          'PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                          'inode INTEGER, hash_name TEXT, hash TEXT)')
+
+    def unchanged(self, file: Path, st: os.stat_result):
+        """Check a source file against its record from the last run.
+
+        - Args:
+            - file (Path): the source file
+            - st (os.stat_result): the source file's stat
+
+        - Returns:
+            - bool: True if the file can be skipped
+        """
+        rel = rel_path(file)
+        with self.lock:
+            row = self.conn.execute('SELECT size, mtime_ns, inode, '
+                                    'hash_name FROM files WHERE path = ?',
+                                    (rel,)).fetchone()
+        if row != (st.st_size, st.st_mtime_ns, st.st_ino, self.hash_name):
+            return False
+        try:
+            return os.stat(os.path.join(self.target, rel),
+                           follow_symlinks=False).st_size == st.st_size
+        except OSError:
+            return False
+
+    def record(self, file: Path, st: os.stat_result, hash_hex: str):
+        """Add or replace the record of a validated file.
+
+        - Args:
+            - file (Path): the source file
+            - st (os.stat_result): the source stat taken when it was copied
+            - hash_hex (str): the validated hash
+        """
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES '
+                              '(?, ?, ?, ?, ?, ?)',
+                              (rel_path(file), st.st_size, st.st_mtime_ns,
+                               st.st_ino, self.hash_name, hash_hex))
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self.pending = 0
+        return
+
+    def close(self):
+        """Commit any pending records and close the index."""
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def sync_filter(tree, stats_dict: dict, index: SyncIndex):
+    """Drop unchanged files from the tree walk so only new or changed files
+    are copied. stats_dict is reduced to match.
+
+    - Args:
+        - tree (WalkTree): the tree walk files
+        - stats_dict (dict): the tree walk stats
+        - index (SyncIndex): the open sync index
+
+    - Returns:
+        - [dict]: 'num_files' and 'file_size' of the skipped files
+    """
+    skip_dict = {'num_files': 0, 'file_size': 0}
+    for idx, file, st in tree.entries():
+        if index.unchanged(file, st):
+            tree.drop(idx)
+            skip_dict['num_files'] += 1
+            skip_dict['file_size'] += st.st_size
+            bp([f'Unchanged: {file}', Ct.A], num=0, veb=2)
+    stats_dict['num_files'] -= skip_dict['num_files']
+    stats_dict['file_size'] -= skip_dict['file_size']
+    return skip_dict
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def sync_stream(file_iter, index: SyncIndex, skip_dict: dict):
+    """sync_filter for the streaming walk: pass on only new or changed files.
+
+    - Args:
+        - file_iter (iter): (file, os.stat) pairs
+        - index (SyncIndex): the open sync index
+        - skip_dict (dict): 'num_files' and 'file_size' of skipped files,
+                            updated as they are skipped
+
+    - Yields:
+        - [tuple]: the (file, os.stat) pairs that need a copy
+    """
+    for file, st in file_iter:
+        if index.unchanged(file, st):
+            skip_dict['num_files'] += 1
+            skip_dict['file_size'] += st.st_size
+            bp([f'Unchanged: {file}', Ct.A], num=0, veb=2)
+        else:
+            yield file, st
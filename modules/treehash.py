@@ -0,0 +1,168 @@
+"""treehash v0.0.1"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+
+
+# ~~~ #        variables
+# --hash names starting with this are tree hashes of the named algorithm
+TREE_PREFIX = 'tree-'
+# leaf size; part of the digest, so changing it changes every tree hash
+TREE_CHUNK = 4 * 1024 * 1024
+# leaves hashed at once; hashlib releases the GIL on large updates, so a
+# thread per core scales without the pickling cost of a process pool
+TREE_THREADS = os.cpu_count() or 1
+# leaves a single file may have in flight before update waits
+TREE_INFLIGHT = TREE_THREADS * 2
+# shared by every TreeHash; created on first use
+tree_pool = None
+tree_pool_lock = threading.Lock()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def tree_hashes():
+    """The --hash names of the available tree hashes: every guaranteed
+    hashlib algorithm with a fixed digest length.
+
+    - Returns:
+        - list: the sorted tree hash names
+    """
+    return [f'{TREE_PREFIX}{z}' for z in sorted(hashlib.algorithms_guaranteed)
+            if 'shake' not in z]
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def hash_new(name: str):
+    """Create the hash object for a --hash name.
+
+    - Args:
+        - name (str): a hashlib algorithm or a tree hash name
+
+    - Returns:
+        - [hashlib]: a hashlib object, or a TreeHash for tree hash names
+    """
+    if name.startswith(TREE_PREFIX):
+        return TreeHash(name[len(TREE_PREFIX):])
+    return getattr(hashlib, name)()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def leaf_hash(name: str, chunk):
+    """Hash one leaf, with the RFC 6962 0x00 leaf prefix.
+
+    - Args:
+        - name (str): the hashlib algorithm
+        - chunk (bytes): the leaf data
+
+    - Returns:
+        - bytes: the leaf digest
+    """
+    hlib = getattr(hashlib, name)(b'\x00')
+    hlib.update(chunk)
+    return hlib.digest()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def tree_root(name: str, nodes: list):
+    """Combine leaf digests into the RFC 6962 Merkle root: split at the
+    largest power of two below the count and hash the two sub roots with the
+    0x01 node prefix.
+
+    - Args:
+        - name (str): the hashlib algorithm
+        - nodes (list): the leaf digests in file order; at least one
+
+    - Returns:
+        - bytes: the root digest
+    """
+    if len(nodes) == 1:
+        return nodes[0]
+    split = 1 << ((len(nodes) - 1).bit_length() - 1)
+    return getattr(hashlib, name)(b'\x01' + tree_root(name, nodes[:split]) +
+                                  tree_root(name, nodes[split:])).digest()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class TreeHash:
+    """A hashlib-like object for the tree hashes. Data is cut into
+    TREE_CHUNK leaves, each full leaf is hashed on the shared thread pool
+    while the caller keeps reading, and hexdigest combines the leaves into a
+    Merkle root. A file of one leaf or less never touches the pool, and an
+    empty file hashes to the algorithm's empty digest.
+
+    - Args:
+        - name (str): the hashlib algorithm for leaves and nodes
+    """
+    def __init__(self, name: str):
+        self.algorithm = name
+        self.name = f'{TREE_PREFIX}{name}'
+        probe = getattr(hashlib, name)()
+        self.digest_size = probe.digest_size
+        self.block_size = probe.block_size
+        # the partial leaf still being filled
+        self.pending = bytearray()
+        # leaf futures in file order, and how many are known to be done
+        self.leaves = []
+        self.done = 0
+
+    def update(self, data):
+        """Add data; the caller may reuse its buffer as soon as this returns.
+
+        - Args:
+            - data (bytes-like): the next bytes of the file
+        """
+        with memoryview(data) as mv, mv.cast('B') as mv:
+            offset = 0
+            if self.pending:
+                offset = min(TREE_CHUNK - len(self.pending), len(mv))
+                self.pending += mv[:offset]
+                if len(self.pending) == TREE_CHUNK:
+                    self.leaf_submit(self.pending)
+                    self.pending = bytearray()
+            while len(mv) - offset >= TREE_CHUNK:
+                self.leaf_submit(mv[offset:offset + TREE_CHUNK].tobytes())
+                offset += TREE_CHUNK
+            self.pending += mv[offset:]
+        return
+
+    def leaf_submit(self, chunk):
+        """Queue a full leaf on the pool, waiting on the oldest leaf first if
+        this file already has TREE_INFLIGHT of them queued.
+
+        - Args:
+            - chunk (bytes-like): the leaf data; must not be reused
+        """
+        global tree_pool
+        with tree_pool_lock:
+            if tree_pool is None:
+                tree_pool = ThreadPoolExecutor(max_workers=TREE_THREADS)
+        if len(self.leaves) - self.done >= TREE_INFLIGHT:
+            self.leaves[self.done].result()
+            self.done += 1
+        self.leaves.append(tree_pool.submit(leaf_hash, self.algorithm,
+                                            chunk))
+        return
+
+    def digest(self):
+        """Wait for the leaves and return the Merkle root.
+
+        - Returns:
+            - bytes: the root digest
+        """
+        nodes = [future.result() for future in self.leaves]
+        if self.pending:
+            nodes.append(leaf_hash(self.algorithm, self.pending))
+        if not nodes:
+            return getattr(hashlib, self.algorithm)().digest()
+        return tree_root(self.algorithm, nodes)
+
+    def hexdigest(self):
+        """Wait for the leaves and return the Merkle root.
+
+        - Returns:
+            - str: the root digest in hexadecimal
+        """
+        return self.digest().hex()
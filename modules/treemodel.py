@@ -0,0 +1,209 @@
+"""treemodel v0.0.1"""
+
+
+from array import array
+import os
+from pathlib import Path
+import sys
+from modules.options import args
+
+
+# ~~~ #        variables
+# the source root with its separator; every walked path starts with it
+SOURCE_ROOT = os.path.join(args.source, '') if args.source else ''
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def target_path(source) -> str:
+    """Get the target path of a walked source path by swapping its root.
+
+    - Args:
+        - source (Path): a file or folder under the source root
+
+    - Returns:
+        - str: the same relative path under the target root
+    """
+    return os.path.join(args.target, str(source)[len(SOURCE_ROOT):])
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class DirNode:
+    """One walked folder. Every file in it shares the node, so a file keeps
+    only the node's index and its own name.
+
+    - Args:
+        - parent (DirNode): the parent folder; None for the source root
+        - name (str): the folder name
+        - st (os.stat_result): the folder stat
+    """
+    __slots__ = ('parent', 'name', 'rel', 'st')
+
+    def __init__(self, parent, name: str, st: os.stat_result):
+        self.parent = parent
+        self.name = name
+        # the path relative to the source root, with a trailing separator
+        self.rel = f'{parent.rel}{name}{os.sep}' if parent else ''
+        self.st = st
+
+    def source(self):
+        """Get the folder's source path."""
+        return Path(f'{SOURCE_ROOT}{self.rel}')
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class FileStat:
+    """The parts of a file's os.stat_result used by the copy, rebuilt from
+    the WalkTree columns when the file is handed out. st_dev and st_blksize
+    are the file's folder's.
+    """
+    __slots__ = ('st_size', 'st_mtime_ns', 'st_atime_ns', 'st_mode',
+                 'st_ino', 'st_dev', 'st_blksize')
+
+    def __init__(self, size: int, mtime_ns: int, atime_ns: int, mode: int,
+                 ino: int, dir_st: os.stat_result):
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_atime_ns = atime_ns
+        self.st_mode = mode
+        self.st_ino = ino
+        self.st_dev = dir_st.st_dev
+        self.st_blksize = getattr(dir_st, 'st_blksize', 0)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class WalkTree:
+    """The walked source tree kept compact: folders are DirNodes and files
+    are rows in array columns (folder index, name, size, mtime, atime, mode,
+    inode). Names are interned, so the names repeated across a tree are
+    stored once. Paths and stats are only built while iterating, which
+    yields (file path, FileStat) pairs like the old file dict's items; the
+    paths are str, as a Path costs more to make than the rest of the row.
+    """
+    def __init__(self):
+        self.dirs = [DirNode(None, '', os.stat(args.source))]
+        # k: folder path as walked; v: its index in dirs. Only needed to
+        # find the parent of each entry during the walk
+        self.dir_index = {SOURCE_ROOT.rstrip(os.sep) or SOURCE_ROOT: 0}
+        self.parent = array('I')
+        self.name = []
+        self.size = array('q')
+        self.mtime_ns = array('q')
+        self.atime_ns = array('q')
+        self.mode = array('I')
+        self.ino = array('Q')
+        # 1 for each file dropped by drop; None until the first drop
+        self.skip = None
+        self.dropped = 0
+
+    def add_dir(self, path: str, st: os.stat_result):
+        """Add a walked folder; its parent must already be added.
+
+        - Args:
+            - path (str): the folder path
+            - st (os.stat_result): the folder stat
+        """
+        parent, name = os.path.split(path)
+        self.dir_index[path] = len(self.dirs)
+        self.dirs.append(DirNode(self.dirs[self.dir_index[parent]],
+                                 sys.intern(name), st))
+        return
+
+    def add_file(self, path: str, st: os.stat_result):
+        """Add a walked file; its folder must already be added.
+
+        - Args:
+            - path (str): the file path
+            - st (os.stat_result): the file stat
+        """
+        parent, name = os.path.split(path)
+        self.parent.append(self.dir_index[parent])
+        self.name.append(sys.intern(name))
+        self.size.append(st.st_size)
+        self.mtime_ns.append(st.st_mtime_ns)
+        self.atime_ns.append(st.st_atime_ns)
+        self.mode.append(st.st_mode)
+        self.ino.append(st.st_ino)
+        return
+
+    def done(self, order: bool):
+        """End the walk: drop the walk-time lookup and optionally sort.
+
+        - Args:
+            - order (bool): True sorts folders and files by path, so a
+                            parallel walk gives the same order every run
+        """
+        self.dir_index = None
+        if order:
+            self.sort()
+        return
+
+    def sort(self):
+        """Sort folders by path (each still before the folders inside it)
+        and files by folder then name."""
+        order = sorted(range(1, len(self.dirs)),
+                       key=lambda z: self.dirs[z].rel.split(os.sep))
+        new_index = {0: 0}
+        new_index.update((old, new) for new, old in enumerate(order, 1))
+        self.dirs = [self.dirs[0]] + [self.dirs[z] for z in order]
+        parent = [new_index[z] for z in self.parent]
+        rows = sorted(range(len(parent)),
+                      key=lambda z: (parent[z], self.name[z]))
+        self.parent = array('I', (parent[z] for z in rows))
+        self.name = [self.name[z] for z in rows]
+        for column in ('size', 'mtime_ns', 'atime_ns', 'mode', 'ino'):
+            values = getattr(self, column)
+            setattr(self, column, array(values.typecode,
+                                        (values[z] for z in rows)))
+        return
+
+    def folders(self):
+        """Yield each walked folder, parents first.
+
+        - Yields:
+            - [tuple]: 0 = folder Path, 1 = os.stat_result
+        """
+        for node in self.dirs[1:]:
+            yield node.source(), node.st
+
+    def num_dirs(self):
+        """Get the number of walked folders, not counting the root."""
+        return len(self.dirs) - 1
+
+    def entries(self):
+        """Yield each file not dropped, with its row index.
+
+        - Yields:
+            - [tuple]: 0 = row index, 1 = file path (str), 2 = FileStat
+        """
+        dirs, skip = self.dirs, self.skip
+        rows = zip(self.parent, self.name, self.size, self.mtime_ns,
+                   self.atime_ns, self.mode, self.ino)
+        for idx, (parent, name, size, mtime_ns, atime_ns, mode, ino) in \
+                enumerate(rows):
+            if skip and skip[idx]:
+                continue
+            node = dirs[parent]
+            yield (idx, f'{SOURCE_ROOT}{node.rel}{name}',
+                   FileStat(size, mtime_ns, atime_ns, mode, ino, node.st))
+
+    def __iter__(self):
+        """Yield (file path, FileStat) for each file not dropped."""
+        for _, file, st in self.entries():
+            yield file, st
+
+    def __len__(self):
+        """Get the number of files not dropped."""
+        return len(self.name) - self.dropped
+
+    def drop(self, idx: int):
+        """Leave a file out of later iterations.
+
+        - Args:
+            - idx (int): the row index from entries
+        """
+        if self.skip is None:
+            self.skip = bytearray(len(self.name))
+        if not self.skip[idx]:
+            self.skip[idx] = 1
+            self.dropped += 1
+        return
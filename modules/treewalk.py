@@ -1,65 +1,296 @@
-
-
-from collections import defaultdict as dd
+from collections import deque
+import os
 from pathlib import Path
+import queue
+import threading
 from betterprint.betterprint import bp
 from betterprint.colortext import Ct
 from modules.timer import perf_timer
 from modules.options import args
+from modules.pathfilter import filter_args
+from modules.treemodel import WalkTree
+
+
+# ~~~ #        variables
+# listed folders waiting for the consumer during a parallel walk
+WALK_QUEUE = 1024
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def dir_scan(folder: str, path_filter, root_len: int, stats: bool,
+             report: bool):
+    """List one folder for tree_scan. Excluded folders are dropped here, so
+    they are never listed.
+
+    - Args:
+        - folder (str): the folder to list
+        - path_filter (PathFilter): the compiled exclusions
+        - root_len (int): length of the source root path, with separator
+        - stats (bool): False skips the stat and uses None
+        - report (bool): False skips error output
+
+    - Returns:
+        - [tuple]: 0 = list of ('dir' or 'file', DirEntry, os.stat_result),
+                   1 = list of sub folders to list next
+    """
+    scan_list, sub_list = [], []
+    try:
+        with os.scandir(folder) as it:
+            entries = list(it)
+    except OSError as e:
+        if report:
+            bp([f'tree walk failure: {e.filename}\n{e}', Ct.RED], err=2)
+        return scan_list, sub_list
+    for entry in entries:
+        # filters match the '/' separated path relative to the source root
+        rel = entry.path[root_len:]
+        if os.sep != '/':
+            rel = rel.replace(os.sep, '/')
+        try:
+            # symlinked folders are listed but not followed
+            if entry.is_dir():
+                if path_filter.dir_skip(rel):
+                    continue
+                kind = 'dir'
+            elif path_filter.file_skip(rel):
+                continue
+            else:
+                kind = 'file'
+            # a symlinked file is copied as the file it points to, so it is
+            # counted with that file's stat
+            st = entry.stat(follow_symlinks=kind == 'file') if stats else None
+        except OSError as e:
+            if report:
+                bp([f'tree walk failure: {entry.path}\n{e}', Ct.RED], err=2)
+            continue
+        # only a folder that made it into the tree is listed
+        if kind == 'dir' and not entry.is_symlink():
+            sub_list.append(entry.path)
+        scan_list.append((kind, entry, st))
+    return scan_list, sub_list
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+class WalkQueue:
+    """The folders still to list in a parallel walk. Each walker has its own
+    deque and takes its newest folder (depth first, close to what it just
+    listed); an idle walker steals the oldest folder from another walker,
+    which is the one nearest the root and so most likely to hold more work.
+
+    - Args:
+        - walkers (int): number of walker threads
+        - root (str): the first folder to list
+    """
+    def __init__(self, walkers: int, root: str):
+        self.deques = [deque() for _ in range(walkers)]
+        self.deques[0].append(root)
+        # folders queued or being listed; the walk ends when it hits 0
+        self.pending = 1
+        self.stop = False
+        self.cv = threading.Condition()
+
+    def get(self, idx: int):
+        """Get the next folder for walker idx, waiting while other walkers
+        may still find more.
+
+        - Args:
+            - idx (int): the walker number
+
+        - Returns:
+            - str: the folder, or None when the walk is done
+        """
+        with self.cv:
+            while True:
+                if self.stop or not self.pending:
+                    return None
+                if self.deques[idx]:
+                    return self.deques[idx].pop()
+                for victim in self.deques:
+                    if victim:
+                        return victim.popleft()
+                self.cv.wait()
+
+    def done(self, idx: int, sub_list: list):
+        """Queue the sub folders found by walker idx and retire its folder.
+
+        - Args:
+            - idx (int): the walker number
+            - sub_list (list): the sub folders to list
+        """
+        with self.cv:
+            self.deques[idx].extend(sub_list)
+            self.pending += len(sub_list) - 1
+            if not self.pending:
+                self.cv.notify_all()
+            elif sub_list:
+                self.cv.notify(len(sub_list))
+        return
+
+    def close(self):
+        """Stop the walkers early."""
+        with self.cv:
+            self.stop = True
+            self.cv.notify_all()
+        return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def tree_scan(stats=True, report=True):
+    """Walk the source folder with os.scandir, top-down, so each folder is
+    yielded before anything inside it. The DirEntry stat data is reused, so
+    there is at most one stat call per entry (none with stats=False on
+    filesystems that report the entry type). Excluded folders are pruned
+    here and never opened. With --walkers above 1, folders are listed by
+    that many threads at once; the entries are the same but their order
+    varies between runs.
+
+    - Args:
+        - stats (bool, optional): False skips the stat and yields None.
+                                  Defaults to True.
+        - report (bool, optional): False skips error output for a second
+                                   pass over the same tree. Defaults to True.
+
+    - Yields:
+        - [tuple]: 0 = 'dir' or 'file', 1 = DirEntry, 2 = os.stat_result
+    """
+    path_filter = filter_args()
+    root_len = len(os.path.join(args.source, ''))
+    if args.walkers > 1:
+        yield from tree_scan_parallel(path_filter, root_len, stats, report)
+        return
+    stack = [args.source]
+    while stack:
+        scan_list, sub_list = dir_scan(stack.pop(), path_filter, root_len,
+                                       stats, report)
+        stack.extend(sub_list)
+        yield from scan_list
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def tree_scan_parallel(path_filter, root_len: int, stats: bool,
+                       report: bool):
+    """tree_scan with --walkers threads listing folders from a WalkQueue.
+    A folder's listing is handed to the consumer before its sub folders are
+    queued, so the walk is still top-down.
+
+    - Args:
+        - path_filter (PathFilter): the compiled exclusions
+        - root_len (int): length of the source root path, with separator
+        - stats (bool): False skips the stat and yields None
+        - report (bool): False skips error output
+
+    - Yields:
+        - [tuple]: 0 = 'dir' or 'file', 1 = DirEntry, 2 = os.stat_result
+    """
+    walk_queue = WalkQueue(args.walkers, args.source)
+    out_queue = queue.Queue(maxsize=WALK_QUEUE)
+
+    def walker(idx: int):
+        """List folders until the walk is done, then send None."""
+        try:
+            while (folder := walk_queue.get(idx)) is not None:
+                scan_list, sub_list = dir_scan(folder, path_filter, root_len,
+                                               stats, report)
+                if scan_list:
+                    out_queue.put(scan_list)
+                walk_queue.done(idx, sub_list)
+        finally:
+            out_queue.put(None)
+
+    for idx in range(args.walkers):
+        threading.Thread(target=walker, args=(idx,), daemon=True).start()
+    running = args.walkers
+    try:
+        while running:
+            scan_list = out_queue.get()
+            if scan_list is None:
+                running -= 1
+            else:
+                yield from scan_list
+    finally:
+        # a consumer that quits early must not leave walkers blocked
+        walk_queue.close()
+        while running:
+            if out_queue.get() is None:
+                running -= 1
+    return
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
 @perf_timer
 def tree_walk():
-    """Walk the source folder using pathlib. Populate 3 dicts, a folder dict,
-    a file dict, and a stats dict.
+    """Walk the source folder using tree_scan into a compact WalkTree and a
+    stats dict.
 
     - Returns:
-        - [dict]: k: folders; v: size
-        - [dict]: k: files; v: size
+        - [WalkTree]: the folders (WalkTree.folders)
+        - [WalkTree]: the same tree; iterating it yields (file, stat) pairs
         - [dict]:
             'file_size'
             'num_dirs'
             'num_files'
     """
-    try:
-        # ~~~ #             -variables-
-        walk_dirs_dict, walk_files_dict = dd(list), dd(list)
-        stat_dict = {'file_size': 0, 'num_dirs': 0, 'num_files': 0}
-        # create exdir and exfile lists
-        if args.exdir:
-            exdir = args.exdir.split(',')
-        if args.exfile:
-            exfile = args.exfile.split(',')
-        p = Path(args.source)
-
-        # ~~~ #             -rglob-
-        for item in p.rglob('*'):
-            if item.is_dir():
-                # add folders if no folder exclusions
-                if not args.exdir:
-                    walk_dirs_dict[item] = item.stat().st_size
-                    stat_dict['num_dirs'] += 1
-                else:
-                    # add folders if the exclusion is not in the folder path
-                    for z in exdir:
-                        if z not in item:
-                            walk_dirs_dict[item] = item.stat().st_size
-                            stat_dict['num_dirs'] += 1
-            else:
-                # add files if no file exclusions
-                if not args.exfile:
-                    walk_files_dict[item] = item.stat().st_size
-                    stat_dict['num_files'] += 1
-                    stat_dict['file_size'] += item.stat().st_size
-                else:
-                    # add files if the exclusion is not in the folder path
-                    for z in exfile:
-                        if z not in item:
-                            walk_files_dict[item] = item.stat().st_size
-                            stat_dict['num_files'] += 1
-                            stat_dict['file_size'] += item.stat().st_size
-    except OSError as e:
-        bp([f'tree walk failure: {args.source}\n{e}', Ct.RED], err=2)
+    # ~~~ #             -variables-
+    tree = WalkTree()
+    stat_dict = {'file_size': 0, 'num_dirs': 0, 'num_files': 0}
 
-    return walk_dirs_dict, walk_files_dict, stat_dict
+    # ~~~ #             -scandir-
+    for kind, entry, st in tree_scan():
+        if kind == 'dir':
+            tree.add_dir(entry.path, st)
+            stat_dict['num_dirs'] += 1
+        else:
+            tree.add_file(entry.path, st)
+            stat_dict['num_files'] += 1
+            stat_dict['file_size'] += st.st_size
+
+    # ~~~ #             -order-
+    # parallel listings arrive in any order; sorting keeps runs repeatable
+    # and still puts each folder before the folders inside it
+    tree.done(args.walkers > 1)
+
+    return tree, tree, stat_dict
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+@perf_timer
+def tree_count(stat_dict: dict):
+    """The fast counting pass run next to tree_stream: the same walk, but it
+    only updates the totals in stat_dict as it goes and sets 'done' at the
+    end. Folders need no stat, so most of them cost only the listing.
+
+    - Args:
+        - stat_dict (dict): 'file_size', 'num_dirs', 'num_files', and 'done'
+    """
+    for kind, entry, _ in tree_scan(stats=False, report=False):
+        if kind == 'dir':
+            stat_dict['num_dirs'] += 1
+        else:
+            try:
+                stat_dict['file_size'] += entry.stat().st_size
+            except OSError:
+                pass        # tree_stream reports the failure
+            stat_dict['num_files'] += 1
+    stat_dict['done'] = 1
+    return
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def tree_stream(dir_func):
+    """Walk the source and hand out work while the walk is still running.
+    Folders go straight to dir_func (so they exist before their files are
+    copied) and files are yielded for file_logic.
+
+    - Args:
+        - dir_func (function): called with (folder Path, os.stat)
+
+    - Yields:
+        - [tuple]: 0 = file Path, 1 = os.stat
+    """
+    for kind, entry, st in tree_scan():
+        if kind == 'dir':
+            dir_func(Path(entry.path), st)
+        else:
+            yield Path(entry.path), st
+    return
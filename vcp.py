@@ -4,14 +4,22 @@
 from datetime import datetime, timedelta
 from math import floor
 import sys
+import threading
 from time import perf_counter
 from betterprint.betterprint import bp, bp_dict
 from modules.notations import byte_notation
-from modules.createfolder import folder_logic, folder_stat_reset
+from modules.createfolder import folder_dict, folder_logic, folder_one, \
+    folder_stat_reset
 from betterprint.colortext import Ct
-from modules.freespace import free_space
-from modules.multifile import file_logic
+from modules.freespace import free_space, space_guard
+import modules.instrument as instrument
+from modules.multifile import file_logic, file_overlap
+from modules.manifest import Manifest, manifest_verify
+import modules.metrics as metrics
 import modules.options as options
+import modules.results as results
+import modules.resume as resume
+from modules.syncindex import SyncIndex, sync_filter, sync_stream
 import modules.treewalk
 START_PROG_TIME = perf_counter()
 
@@ -19,9 +27,78 @@ START_PROG_TIME = perf_counter()
 start_time = datetime.now()
 
 
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
+def stream_main(sync_index, manifest):
+    """The --stream version of the walk, folder, and file phases. Folders are
+    created and files copied as the walk finds them, while a counting pass
+    fills in the totals for the status display. Free space is checked as
+    files are handed out instead of up front.
+
+    - Args:
+        - sync_index (SyncIndex): the --sync index or None
+        - manifest (Manifest): the --manifest or None
+
+    - Returns:
+        - [tuple]: shaped like the non-stream phase returns
+            - 0: tree_walk return (counting pass time, stats in [2][2])
+            - 1: folder_logic return (folder time, results in [2])
+            - 2: file_logic return
+    """
+    # ~~~ #             -counting pass-
+    stat_dict = {'file_size': 0, 'num_dirs': 0, 'num_files': 0, 'done': 0}
+    count_return = []
+    count_thread = threading.Thread(
+        target=lambda: count_return.extend(modules.treewalk.tree_count(
+            stat_dict)), daemon=True)
+    count_thread.start()
+
+    # ~~~ #             -free space-
+    target_space = free_space(args.target)
+    bp([f'Source - streaming; totals are counted during the copy\nTarget - '
+        f'Free: {byte_notation(target_space["free_bytes"], ntn=1)[1]:>10}',
+        Ct.A])
+    bp([f'\n{"━" * 40}\n', Ct.A], log=0)
+
+    # ~~~ #             -folders and files-
+    folder_return = ['folder_stream', 0.0, folder_dict()]
+
+    def stream_folder(folder, st):
+        """tree_stream dir_func: create the folder and add up its time."""
+        t_start = perf_counter()
+        folder_one(folder, folder_return[2])
+        folder_return[1] += perf_counter() - t_start
+
+    file_iter = modules.treewalk.tree_stream(stream_folder)
+    skip_dict = {'num_files': 0, 'file_size': 0}
+    if sync_index:
+        file_iter = sync_stream(file_iter, sync_index, skip_dict)
+    if resume.journal:
+        file_iter = sync_stream(file_iter, resume.journal, skip_dict)
+    # only files that will be copied count against the free space
+    file_iter = space_guard(file_iter, target_space)
+    file_return = file_logic(file_iter, stat_dict, sync_index, manifest)
+    count_thread.join()
+    if target_space['exceeded']:
+        bp(['not enough free space to copy all the data.', Ct.RED], err=2)
+        sys.exit(1)
+    if sync_index or resume.journal:
+        bp([f'{"Sync" if sync_index else "Resume"} - Unchanged: '
+            f'{skip_dict["num_files"]:,} files ('
+            f'{byte_notation(skip_dict["file_size"], ntn=1)[1]}) skipped',
+            Ct.A])
+        stat_dict['num_files'] -= skip_dict['num_files']
+        stat_dict['file_size'] -= skip_dict['file_size']
+    bp([f'Folders - Success: {folder_return[2]["success"]}/'
+        f'{stat_dict["num_dirs"]} | Failure: {folder_return[2]["failure"]}/'
+        f'{stat_dict["num_dirs"]}', Ct.A])
+    tree_return = (count_return[0], count_return[1], ({}, {}, stat_dict))
+    return tree_return, folder_return, file_return
+
+
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
 def main():
 
+    sync_index, manifest, metrics_export = None, None, None
     try:
         # ~~~ #             -init display-
         bp([f'\t{options.copyright}\n\t{options.license_info}\n{"━" * 40}',
@@ -41,70 +118,142 @@ def main():
                     bp([f' {k}: {v} |', Ct.A], inl=1, log=0)
         bp([f'\n\n{"━" * 40}\n', Ct.A], log=0)
 
-        # ~~~ #             -tree walk-
-        tree_return = modules.treewalk.tree_walk()
-        tw_tup = tree_return[2]
-        folder_total = f'{tw_tup[2]["num_dirs"]:,}'
-        file_total = f'{tw_tup[2]["num_files"]:,}'
-        file_size_total = byte_notation(tw_tup[2]["file_size"], ntn=1)
-
-        # ~~~ #             -free space-
-        target_space = free_space(args.target)
-        target_space_bytenote = byte_notation(target_space['free_bytes'],
-                                              ntn=1)
-        # print out the tree walk data
-        bp([f'Source - Size: {file_size_total[1]:>10} | Folders: '
-            f'{folder_total} | Files: {file_total}\nTarget - Free: '
-            f'{target_space_bytenote[1]:>10}', Ct.A])
-        if tw_tup[2]["file_size"] >= target_space['free_bytes']:
-            bp(['not enough free space to copy all the data.', Ct.RED], err=2)
-            sys.exit(1)
-        bp([f'\n{"━" * 40}\n', Ct.A], log=0)
+        if args.sync:
+            sync_index = SyncIndex(args.target)
+        if args.manifest:
+            manifest = Manifest(args.manifest)
+        if args.resume:
+            resume.journal_open(args.target)
+        results.store_open()
+        if args.metrics_json or args.metrics_prom:
+            metrics_export = metrics.metrics_open()
+        if instrument.level == 'trace':
+            instrument.tracer_open()
 
-        # ~~~ #             -folder creation-
-        bp(['Create folders...', Ct.A])
-        folder_return = folder_logic(tw_tup[0])
-
-        f_time = folder_return[1]
-        folder_time = f'{f_time:,.4f}'
-        folder_success = folder_return[2]['success']
-        folder_failure = folder_return[2]['failure']
-        bp([f'Success: {folder_success}/{folder_total}\nFailure: '
-            f'{folder_failure}/{folder_total}\nDuration: '
-            f'{timedelta(seconds=floor(f_time))}', Ct.A])
-        bp([f'\n{"━" * 40}\n', Ct.A], log=0)
+        if args.stream:
+            # ~~~ #         -streaming walk, folders, and files-
+            tree_return, folder_return, file_return = stream_main(
+                sync_index, manifest)
+            tw_tup = tree_return[2]
+            f_time = folder_return[1]
+            metrics.phase_done('walk', tree_return[1])
+            metrics.phase_done('folders', f_time)
+            folder_time = f'{f_time:,.4f}'
+            folder_success = folder_return[2]['success']
+            folder_failure = folder_return[2]['failure']
+            folder_total = f'{tw_tup[2]["num_dirs"]:,}'
+            file_total = f'{tw_tup[2]["num_files"]:,}'
+            file_size_total = byte_notation(tw_tup[2]["file_size"], ntn=1)
+        else:
+            # ~~~ #         -tree walk-
+            tree_return = modules.treewalk.tree_walk()
+            tw_tup = tree_return[2]
+            metrics.phase_done('walk', tree_return[1])
+
+            # ~~~ #         -sync-
+            # only new or changed files are left in tw_tup for the copy
+            if sync_index:
+                skip_dict = sync_filter(tw_tup[1], tw_tup[2], sync_index)
+                bp([f'Sync - Unchanged: {skip_dict["num_files"]:,} files ('
+                    f'{byte_notation(skip_dict["file_size"], ntn=1)[1]}) '
+                    'skipped', Ct.A])
+            # then files finished by an interrupted --resume run
+            if resume.journal:
+                skip_dict = sync_filter(tw_tup[1], tw_tup[2], resume.journal)
+                bp([f'Resume - Unchanged: {skip_dict["num_files"]:,} files ('
+                    f'{byte_notation(skip_dict["file_size"], ntn=1)[1]}) '
+                    'skipped', Ct.A])
+            folder_total = f'{tw_tup[2]["num_dirs"]:,}'
+            file_total = f'{tw_tup[2]["num_files"]:,}'
+            file_size_total = byte_notation(tw_tup[2]["file_size"], ntn=1)
+
+            # ~~~ #         -free space-
+            target_space = free_space(args.target)
+            target_space_bytenote = byte_notation(target_space['free_bytes'],
+                                                  ntn=1)
+            # print out the tree walk data
+            bp([f'Source - Size: {file_size_total[1]:>10} | Folders: '
+                f'{folder_total} | Files: {file_total}\nTarget - Free: '
+                f'{target_space_bytenote[1]:>10}', Ct.A])
+            if tw_tup[2]["file_size"] >= target_space['free_bytes']:
+                bp(['not enough free space to copy all the data.', Ct.RED],
+                   err=2)
+                sys.exit(1)
+            bp([f'\n{"━" * 40}\n', Ct.A], log=0)
 
-        # ~~~ #             -file creation-
-        file_return = file_logic(tw_tup[1], tw_tup[2])
+            # ~~~ #         -folder creation-
+            bp(['Create folders...', Ct.A])
+            folder_return = folder_logic(tw_tup[0])
 
-        file_size_success = byte_notation(file_return["val_size"], ntn=1)
+            f_time = folder_return[1]
+            metrics.phase_done('folders', f_time)
+            folder_time = f'{f_time:,.4f}'
+            folder_success = folder_return[2]['success']
+            folder_failure = folder_return[2]['failure']
+            bp([f'Success: {folder_success}/{folder_total}\nFailure: '
+                f'{folder_failure}/{folder_total}\nDuration: '
+                f'{timedelta(seconds=floor(f_time))}', Ct.A])
+            bp([f'\n{"━" * 40}\n', Ct.A], log=0)
+
+            # ~~~ #         -file creation-
+            file_return = file_logic(tw_tup[1], tw_tup[2], sync_index,
+                                     manifest)
+
+        metrics.phase_done('files', file_return['wall_time'])
+        # the per-file counts come from the results store
+        summary = results.store.summary()
+        val_success, val_size = summary.get(results.VALIDATED, (0, 0))
+        copy_failure = summary.get(results.COPY_FAILED, (0, 0))[0]
+        copy_success = sum(files for status, (files, _) in summary.items()
+                           if status != results.COPY_FAILED)
+        val_failure = sum(files for files, _ in summary.values()) - \
+            val_success
+        file_size_success = byte_notation(int(val_size), ntn=1)
         file_size_failure = byte_notation(tw_tup[2]["file_size"] -
-                                          file_return["val_size"], ntn=1)
+                                          int(val_size), ntn=1)
         hex_tot = file_return["hash_time"] + file_return["val_hash_time"]
         file_tot = int(file_return['read_time'] + file_return["write_time"])
         bp([f'\n{"━" * 40}\n', Ct.A], log=0)
 
         # ~~~ #             -folder stat reset-
-        folder_reset = folder_stat_reset(folder_return[2]['success_dict'])
+        folder_reset = folder_stat_reset(folder_return[2])
         f_time += folder_reset[1]
+        metrics.phase_done('stat_reset', folder_reset[1])
 
         # ~~~ #             -final display-
         bp([f'\n{" " * 16}Source    Target    FAILED         TIME', Ct.A])
         bp([f'   Folders: {folder_total:>10}{folder_success:>10,}'
             f'{folder_failure:>10,}{folder_time:>12s}s', Ct.A])
-        bp([f'     Files: {file_total:>10}{file_return["success"]:>10,}'
-           f'{file_return["failure"]:>10,}{file_tot:>12,.4f}s', Ct.A])
+        bp([f'     Files: {file_total:>10}{copy_success:>10,}'
+           f'{copy_failure:>10,}{file_tot:>12,.4f}s', Ct.A])
         bp([f'     Bytes: {file_size_total[1]:>10}{file_size_success[1]:>10}'
            f'{file_size_failure[1]:>10}', Ct.A])
-        bp([f'Validation: {file_total:>10}{file_return["val_success"]:>10,}'
-            f'{file_return["val_failure"]:>10,}{hex_tot:>12,.4f}s (+'
+        bp([f'Validation: {file_total:>10}{val_success:>10,}'
+            f'{val_failure:>10,}{hex_tot:>12,.4f}s (+'
             f'{file_return["val_read_time"]:,.4f}s)', Ct.A])
+        if copy_failure or val_failure:
+            bp(['', Ct.A])
+            results.failure_report(results.store)
         bp([f'\n\n{"━" * 40}\n', Ct.A], log=0)
         end_time = perf_counter()
         total_time = end_time - START_PROG_TIME
-        tft = (tree_return[1] + f_time + file_return["read_time"] +
-               file_return["hash_time"] + file_return["write_time"] +
-               file_return["val_read_time"] + file_return["val_hash_time"])
+        # overlapping stage times don't add up, so use wall time for those
+        if not file_overlap():
+            file_fn_time = (file_return["read_time"] +
+                            file_return["hash_time"] +
+                            file_return["write_time"] +
+                            file_return["val_read_time"] +
+                            file_return["val_hash_time"])
+        else:
+            file_fn_time = file_return['wall_time']
+            if instrument.level == 'off':
+                bp([f'File stage times are not measured with --instrument '
+                    f'off; {file_fn_time:,.4f}s wall time.', Ct.A])
+            else:
+                bp([f'File times below are summed across overlapping '
+                    f'stages; {file_fn_time:,.4f}s wall time.', Ct.A])
+        # the --stream counting pass runs alongside the copy, not before it
+        tft = (0 if args.stream else tree_return[1]) + f_time + file_fn_time
         bp([f'\n{total_time:,.4f}s - Total Time\n{tree_return[1]:,.4f}s - Tree'
             f' Walk Time\n{folder_time:}s - FolderCreation Time\n'
             f'{file_return["read_time"]:,.4f}s - Source Read Time\n'
@@ -118,6 +267,22 @@ def main():
     except KeyboardInterrupt:
         bp(['Ctrl+C pressed...\n', Ct.RED], err=2)
         sys.exit(1)
+    finally:
+        # keep the files validated so far for the next --sync run
+        if sync_index:
+            sync_index.close()
+        if manifest:
+            manifest.close()
+        # a Ctrl+C still leaves a complete journal for the next --resume
+        if resume.journal:
+            resume.journal.close()
+        if instrument.tracer:
+            instrument.tracer.close()
+        if results.store:
+            results.store.close()
+        # the final metrics cover the whole run, interrupted or not
+        if metrics_export:
+            metrics_export.close()
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ #
@@ -137,6 +302,16 @@ if __name__ == '__main__':
     bp_dict['color'] = 0 if args.no_color else 1
     bp_dict['quiet'] = args.quiet
 
+    # ~~~ #                 -verify manifest-
+    if args.verify_manifest:
+        try:
+            verify_return = manifest_verify(args.verify_manifest)
+        except KeyboardInterrupt:
+            bp(['Ctrl+C pressed...\n', Ct.RED], err=2)
+            sys.exit(1)
+        sys.exit(1 if verify_return['FAILED'] or verify_return['MISSING']
+                 else 0)
+
     # ~~~ #                 -main-
     bp(['calling main().', Ct.BMAGENTA], veb=2, num=0)
     main()